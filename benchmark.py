@@ -0,0 +1,598 @@
+"""
+Offline benchmarks against a local fake Toutiao.
+
+--suite e2e (default) serves a fake channel, its video pages and a CDN on
+localhost, runs the real pipeline (crawl_and_download_from_channel ->
+resolver -> downloads -> mux) against them and reports videos/minute, CPU
+seconds, peak RSS and Chrome instance-seconds. Needs chromedriver
+(DRIVER_PATH) and ffmpeg, like main.py.
+
+    python benchmark.py --videos 50 --mode split --latency 0.05 --bandwidth 4M
+
+--suite cards compares reading the cards of a static channel page with one
+EXTRACT_CARDS_JS call against per-element find_element round-trips.
+
+    python benchmark.py --suite cards --videos 300 --repeat 5
+
+--suite mux times merge_video_audio on the generated H.264/AAC samples with
+MUX_STREAM_COPY on (stream copy) and off (audio re-encode). Needs ffmpeg.
+
+    python benchmark.py --suite mux --duration 60 --bitrate 4M
+
+--suite download measures download_file throughput and CPU per GB against
+the local CDN for each --chunk-sizes value, streamed and segmented.
+
+    python benchmark.py --suite download --size 256M --chunk-sizes 64K 1M 4M
+
+Each run works in a fresh directory, so state.db and the URL cache start empty.
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from html import escape
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+FIRST_VIDEO_ID = 7400000000000000000
+SEND_CHUNK = 64 * 1024
+
+CHANNEL_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Benchmark channel</title>
+<style>.feed-card-video-multi-item { height: 240px; border-bottom: 1px solid #ddd; }</style>
+</head><body><div id="feed"></div>
+<script>
+var offset = 0, loading = false, done = false;
+function addCard(feed, c) {
+    var card = document.createElement('div');
+    card.className = 'feed-card-video-multi-item';
+    var cover = document.createElement('div');
+    cover.className = 'feed-card-cover';
+    var a = document.createElement('a');
+    a.href = c.href;
+    a.title = c.title;
+    a.textContent = c.title;
+    cover.appendChild(a);
+    var time = document.createElement('div');
+    time.className = 'feed-card-footer-time-cmp';
+    time.textContent = c.time;
+    card.appendChild(cover);
+    card.appendChild(time);
+    feed.appendChild(card);
+}
+function more() {
+    if (loading || done) return;
+    loading = true;
+    fetch('/feed?offset=' + offset).then(function (r) { return r.json(); }).then(function (cards) {
+        var feed = document.getElementById('feed');
+        cards.forEach(function (c) { addCard(feed, c); });
+        offset += cards.length;
+        done = cards.length === 0;
+        loading = false;
+    });
+}
+window.addEventListener('scroll', function () {
+    if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 50) more();
+});
+more();
+</script></body></html>
+"""
+
+# All cards rendered server-side, for the card extraction benchmark
+STATIC_CARD_HTML = """<div class="feed-card-video-multi-item">
+<div class="feed-card-cover"><a href="{href}" title="{title}">{title}</a></div>
+<div class="feed-card-footer-time-cmp">{time}</div>
+</div>"""
+
+# Same nesting as the real page, so the XPath used by _scrape_page matches
+VIDEO_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title></head><body>
+<div id="root"><div><div class="header"></div><div><div><div><div><ul><li></li>
+<li><div><video {video_attrs}></video></div></li>
+</ul></div></div></div></div></div></div>
+<script id="RENDER_DATA" type="application/json">{render_data}</script>
+{player}
+</body></html>
+"""
+
+# Split mode: attach a MediaSource (blob: src) and request both streams, like the real player
+SPLIT_PLAYER_JS = """<script>
+var video = document.querySelector('video');
+video.src = URL.createObjectURL(new MediaSource());
+[{v_url}, {a_url}].forEach(function (url) {{
+    fetch(url, {{mode: 'no-cors'}}).catch(function () {{}});
+}});
+</script>"""
+
+
+def parse_rate(value):
+    # "4M" -> 4194304 bytes per second; 0 means unlimited
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)([KMG]?)", value.strip().upper())
+    if not m:
+        raise argparse.ArgumentTypeError(f"invalid rate: {value}")
+    return int(float(m.group(1)) * {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}[m.group(2)])
+
+
+def generate_media(media_dir, duration, bitrate):
+    """
+    Create the files served by the fake CDN: an H.264 video-only stream, an
+    AAC audio-only stream and a muxed single-source file. Reused across runs.
+    """
+    if not shutil.which("ffmpeg"):
+        sys.exit("ffmpeg is required to generate the benchmark media.")
+    os.makedirs(media_dir, exist_ok=True)
+    video_in = ["-f", "lavfi", "-i", f"testsrc=size=640x360:rate=25:duration={duration}"]
+    audio_in = ["-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}"]
+    video_enc = ["-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", "-b:v", bitrate]
+    audio_enc = ["-c:a", "aac", "-b:a", "128k"]
+    jobs = {
+        "video": (f"video_{duration}s_{bitrate}.mp4", video_in + video_enc + ["-an"]),
+        "audio": (f"audio_{duration}s.m4a", audio_in + audio_enc + ["-vn"]),
+        "single": (f"single_{duration}s_{bitrate}.mp4", video_in + audio_in + video_enc + audio_enc),
+    }
+    files = {}
+    for kind, (name, args) in jobs.items():
+        path = os.path.join(media_dir, name)
+        if not os.path.exists(path):
+            subprocess.run(["ffmpeg", "-y", "-loglevel", "error"] + args + [path], check=True)
+        files[kind] = path
+    return files
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    """Channel pages, the feed they load on scroll and the video pages."""
+
+    protocol_version = "HTTP/1.1"
+    videos = 0
+    page_size = 20
+    mode = "split"
+    cdn = ""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body, content_type="text/html; charset=utf-8"):
+        body = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith("/c/user/token/"):
+            self._send(CHANNEL_HTML)
+        elif url.path == "/static-channel/":
+            cards = "\n".join(STATIC_CARD_HTML.format(**{k: escape(v) for k, v in card.items()})
+                              for card in self._feed(0, self.videos))
+            self._send(f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"></head><body>{cards}</body></html>")
+        elif url.path == "/feed":
+            offset = int(parse_qs(url.query).get("offset", ["0"])[0])
+            self._send(json.dumps(self._feed(offset)), "application/json")
+        elif re.fullmatch(r"/video/\d+/", url.path):
+            self._send(self._video_page(url.path.split("/")[2]))
+        else:
+            self.send_error(404)
+
+    def _feed(self, offset, count=None):
+        host = f"http://{self.headers['Host']}"
+        newest = date(2024, 12, 31)
+        cards = []
+        for idx in range(offset, min(offset + (count or self.page_size), self.videos)):
+            cards.append({
+                "href": f"{host}/video/{FIRST_VIDEO_ID + idx}/",
+                "title": f"Benchmark video {idx:05d}",
+                "time": (newest - timedelta(days=idx)).strftime("%Y年%m月%d日"),
+            })
+        return cards
+
+    def _video_page(self, video_id):
+        # Signed-looking URLs, so the resolved-URL cache sees a real expiry
+        expires = int(time.time()) + 3600
+        if self.mode == "single":
+            src = f"{self.cdn}/single/{video_id}.mp4?x-expires={expires}"
+            state = {"data": {"video": {"play_url": src}}}
+            video_attrs, player = f'src="{src}" preload="none"', ""
+        else:
+            v_url = f"{self.cdn}/media-video-avc1/{video_id}.mp4?x-expires={expires}"
+            a_url = f"{self.cdn}/media-audio-und-mp4a/{video_id}.m4a?x-expires={expires}"
+            state = {"data": {"video": {"video_list": [v_url], "audio_list": [a_url]}}}
+            video_attrs = ""
+            player = SPLIT_PLAYER_JS.format(v_url=json.dumps(v_url), a_url=json.dumps(a_url))
+        return VIDEO_HTML.format(
+            title=f"Video {video_id}",
+            video_attrs=video_attrs,
+            render_data=quote(json.dumps(state)),
+            player=player,
+        )
+
+
+class CdnHandler(BaseHTTPRequestHandler):
+    """Serves the generated media for any video ID, with Range support,
+    a fixed latency per request and a per-connection bandwidth cap."""
+
+    protocol_version = "HTTP/1.1"
+    files = {}
+    latency = 0.0
+    bandwidth = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.startswith("/media-video-avc1/"):
+            filepath = self.files["video"]
+        elif path.startswith("/media-audio-und-mp4a/"):
+            filepath = self.files["audio"]
+        elif path.startswith("/single/"):
+            filepath = self.files["single"]
+        else:
+            self.send_error(404)
+            return
+
+        size = os.path.getsize(filepath)
+        start, end = 0, size - 1
+        m = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if m:
+            start = int(m.group(1))
+            end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+        if self.latency:
+            time.sleep(self.latency)
+        self.send_response(206 if m else 200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Timing-Allow-Origin", "*")
+        if m:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+
+        sent, begin = 0, time.time()
+        try:
+            with open(filepath, "rb") as f:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining:
+                    chunk = f.read(min(SEND_CHUNK, remaining))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+                    sent += len(chunk)
+                    if self.bandwidth:
+                        ahead = sent / self.bandwidth - (time.time() - begin)
+                        if ahead > 0:
+                            time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            # The browser stops its own media download once the URLs are captured
+            self.close_connection = True
+
+
+def start_server(handler, **config):
+    handler = type(handler.__name__, (handler,), config)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=handler.__name__, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+class ResourceSampler:
+    """
+    Samples the live Chrome count from the browser budget (integrated into
+    instance-seconds) and, with psutil, the RSS of this process and all of
+    its descendants (chromedriver, Chrome, ffmpeg).
+    """
+
+    def __init__(self, budget, interval=0.2):
+        self.budget = budget
+        self.interval = interval
+        self.chrome_seconds = 0.0
+        self.peak_browsers = 0
+        self.peak_rss = 0
+        self.stop_event = threading.Event()
+        self.process = psutil.Process() if psutil else None
+        self.thread = threading.Thread(target=self._loop, name="Sampler", daemon=True)
+
+    def start(self):
+        self.last = time.time()
+        self.thread.start()
+
+    def _sample(self):
+        now = time.time()
+        live = self.budget.live
+        self.chrome_seconds += live * (now - self.last)
+        self.last = now
+        self.peak_browsers = max(self.peak_browsers, live)
+        if self.process:
+            rss = 0
+            for proc in [self.process] + self.process.children(recursive=True):
+                try:
+                    rss += proc.memory_info().rss
+                except psutil.Error:
+                    pass
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def _loop(self):
+        while not self.stop_event.wait(self.interval):
+            self._sample()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        self._sample()
+
+
+def cpu_seconds():
+    # Children count once reaped: ffmpeg, chromedriver and (through it) Chrome
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def peak_rss_fallback():
+    # Without psutil: the largest single process (this one or a reaped child)
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+
+
+def enter_workdir():
+    # main.py keeps its log, state.db, result/ and temp/ in the working directory
+    workdir = tempfile.mkdtemp(prefix="toutiao-bench-")
+    os.chdir(workdir)
+    import main
+    return workdir, main
+
+
+def leave_workdir(workdir, keep):
+    if not keep:
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_benchmark(args):
+    media_dir = os.path.abspath(args.media_dir)
+    files = generate_media(media_dir, args.duration, args.bitrate)
+
+    cdn, cdn_url = start_server(CdnHandler, files=files, latency=args.latency, bandwidth=args.bandwidth)
+    site, site_url = start_server(SiteHandler, videos=args.videos, page_size=args.page_size,
+                                  mode=args.mode, cdn=cdn_url)
+    channels = [f"{site_url}/c/user/token/BENCH{idx}/" for idx in range(args.channels)]
+
+    workdir, main = enter_workdir()
+    if not args.show_channel:
+        main.options_first.add_argument('--headless')
+
+    sampler = ResourceSampler(main.browser_budget)
+    cpu_start = cpu_seconds()
+    start = time.time()
+    sampler.start()
+    try:
+        main.run_crawl(channels, resolver=args.resolver, stream_merge=args.stream_merge, full=True,
+                       summary_file=os.path.join(workdir, "run_summary.json"), retry_wait=0)
+    finally:
+        sampler.stop()
+        cdn.shutdown()
+        site.shutdown()
+    elapsed = time.time() - start
+
+    summary = main.metrics.summary()
+    downloaded = sum(value for key, value in summary["counters"].items()
+                     if key.startswith("videos_downloaded_total"))
+    report = {
+        "videos": args.videos * args.channels,
+        "discovered": summary["counters"].get("videos_discovered_total", 0),
+        "downloaded": downloaded,
+        "mode": args.mode,
+        "resolver": args.resolver,
+        "elapsed_seconds": round(elapsed, 2),
+        "videos_per_minute": round(downloaded / elapsed * 60, 2) if elapsed else 0,
+        "cpu_seconds": round(cpu_seconds() - cpu_start, 2),
+        "peak_rss_mb": round((sampler.peak_rss or peak_rss_fallback() or 0) / 1024 / 1024, 1),
+        "chrome_instance_seconds": round(sampler.chrome_seconds, 1),
+        "peak_browsers": sampler.peak_browsers,
+        "stages": summary["stages"],
+        "workdir": workdir,
+    }
+    leave_workdir(workdir, args.keep)
+    return report
+
+
+def run_download_benchmark(args):
+    """
+    download_file against the local CDN: MB/s and CPU seconds per GB for each
+    chunk size, once as a single stream and once as DOWNLOAD_SEGMENTS ranges.
+    CPU includes the CDN, which runs in this process; compare runs, not absolutes.
+    """
+    workdir, main = enter_workdir()
+    payload = os.path.join(workdir, "payload.bin")
+    with open(payload, "wb") as f:
+        remaining = args.size
+        while remaining:
+            block = os.urandom(min(SEND_CHUNK * 16, remaining))
+            f.write(block)
+            remaining -= len(block)
+    files = {"single": payload, "video": payload, "audio": payload}
+    cdn, cdn_url = start_server(CdnHandler, files=files, latency=args.latency, bandwidth=args.bandwidth)
+
+    segments, segment_min = main.DOWNLOAD_SEGMENTS, main.DOWNLOAD_SEGMENT_MIN_SIZE
+    results = []
+    try:
+        for chunk_size in args.chunk_sizes:
+            for segmented in (False, True):
+                main.DOWNLOAD_CHUNK_SIZE = chunk_size
+                main.DOWNLOAD_SEGMENTS = segments if segmented else 1
+                main.DOWNLOAD_SEGMENT_MIN_SIZE = 0 if segmented else segment_min
+                cpu_start = cpu_seconds()
+                start = time.time()
+                for idx in range(args.repeat):
+                    out_file = os.path.join(workdir, f"out_{idx}.bin")
+                    main.download_file(f"{cdn_url}/single/{idx}.mp4", out_file)
+                    os.remove(out_file)
+                elapsed = time.time() - start
+                cpu = cpu_seconds() - cpu_start
+                total = args.size * args.repeat
+                results.append({
+                    "chunk_size": chunk_size,
+                    "segmented": segmented,
+                    "mb_per_second": round(total / elapsed / 1024 ** 2, 1),
+                    "cpu_seconds_per_gb": round(cpu / (total / 1024 ** 3), 2),
+                })
+    finally:
+        main.DOWNLOAD_SEGMENTS, main.DOWNLOAD_SEGMENT_MIN_SIZE = segments, segment_min
+        cdn.shutdown()
+        leave_workdir(workdir, args.keep)
+    return {"suite": "download", "size": args.size, "repeat": args.repeat, "results": results}
+
+
+def extract_cards_per_element(driver):
+    # How cards were read before EXTRACT_CARDS_JS: several WebDriver round-trips per card
+    from selenium.webdriver.common.by import By
+    cards = []
+    for el in driver.find_elements(By.CLASS_NAME, 'feed-card-video-multi-item'):
+        title = el.find_element(By.TAG_NAME, "a").get_attribute("title")
+        time_text = el.find_element(By.CLASS_NAME, "feed-card-footer-time-cmp").text
+        href = el.find_element(By.CLASS_NAME, "feed-card-cover").find_element(By.TAG_NAME, "a").get_attribute("href")
+        cards.append((title, href, time_text))
+    return cards
+
+
+def run_cards_benchmark(args):
+    """
+    Card extraction on a static channel page with --videos cards: one
+    EXTRACT_CARDS_JS call (extract_feed_cards) against per-element find_element.
+    """
+    workdir, main = enter_workdir()
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    site, site_url = start_server(SiteHandler, videos=args.videos)
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless')
+    driver = webdriver.Chrome(service=Service(main.DRIVER_PATH), options=options)
+    results = {}
+    try:
+        driver.get(f"{site_url}/static-channel/")
+        methods = (
+            ("execute_script", lambda: main.extract_feed_cards(driver)[0]),
+            ("find_element", lambda: extract_cards_per_element(driver)),
+        )
+        for name, extract in methods:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.time()
+                cards = extract()
+                timings.append(time.time() - start)
+            results[name] = {
+                "cards": len(cards),
+                "best_seconds": round(min(timings), 4),
+                "avg_seconds": round(sum(timings) / len(timings), 4),
+            }
+    finally:
+        driver.quit()
+        site.shutdown()
+        leave_workdir(workdir, args.keep)
+    return {"suite": "cards", "repeat": args.repeat, "results": results}
+
+
+def run_mux_benchmark(args):
+    """
+    merge_video_audio on the samples from generate_media, with and without
+    MUX_STREAM_COPY: wall and CPU seconds per merge (ffmpeg runs as a child).
+    """
+    files = generate_media(os.path.abspath(args.media_dir), args.duration, args.bitrate)
+    workdir, main = enter_workdir()
+    stream_copy = main.MUX_STREAM_COPY
+    results = {}
+    try:
+        for name, enabled in (("stream_copy", True), ("re_encode", False)):
+            main.MUX_STREAM_COPY = enabled
+            timings = []
+            cpu_start = cpu_seconds()
+            for idx in range(args.repeat):
+                out_file = os.path.join(workdir, f"{name}_{idx}.mp4")
+                start = time.time()
+                if not main.merge_video_audio(files["video"], files["audio"], out_file):
+                    sys.exit(f"Merge failed ({name}), see downloader.log in {workdir}")
+                timings.append(time.time() - start)
+                size = os.path.getsize(out_file)
+                os.remove(out_file)
+            results[name] = {
+                "avg_seconds": round(sum(timings) / len(timings), 3),
+                "cpu_seconds_per_merge": round((cpu_seconds() - cpu_start) / args.repeat, 3),
+                "media_seconds_per_second": round(args.duration * len(timings) / sum(timings), 1),
+                "output_bytes": size,
+            }
+    finally:
+        main.MUX_STREAM_COPY = stream_copy
+        leave_workdir(workdir, args.keep)
+    return {"suite": "mux", "duration": args.duration, "bitrate": args.bitrate, "results": results}
+
+
+SUITES = {
+    "e2e": run_benchmark,
+    "mux": run_mux_benchmark,
+    "cards": run_cards_benchmark,
+    "download": run_download_benchmark,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks against a local fake Toutiao")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="e2e")
+    parser.add_argument("--videos", type=int, default=30, help="Video cards per channel")
+    parser.add_argument("--channels", type=int, default=1, help="Number of fake channels")
+    parser.add_argument("--page-size", type=int, default=20, help="Cards loaded per scroll")
+    parser.add_argument("--mode", choices=["single", "split"], default="split",
+                        help='"single": one progressive <video src>; "split": separate avc1/mp4a streams')
+    parser.add_argument("--resolver", choices=["selenium", "http"], default="selenium")
+    parser.add_argument("--stream-merge", action="store_true")
+    parser.add_argument("--duration", type=int, default=10, help="Length of the generated media in seconds")
+    parser.add_argument("--bitrate", default="1M", help="Video bitrate of the generated media (ffmpeg syntax)")
+    parser.add_argument("--latency", type=float, default=0.05, help="CDN latency per request in seconds")
+    parser.add_argument("--bandwidth", type=parse_rate, default="0",
+                        help="CDN bandwidth per connection, e.g. 4M (0: unlimited)")
+    parser.add_argument("--media-dir", default=os.path.join(tempfile.gettempdir(), "toutiao-bench-media"),
+                        help="Where the generated media is cached between runs")
+    parser.add_argument("--size", type=parse_rate, default="256M", help="Payload size for --suite download")
+    parser.add_argument("--chunk-sizes", type=parse_rate, nargs="+", default=[64 * 1024, 1024 ** 2, 4 * 1024 ** 2],
+                        help="Download chunk sizes to compare, e.g. 64K 1M 4M")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per configuration for the micro-benchmarks")
+    parser.add_argument("--show-channel", action="store_true", help="Don't force the channel browser headless")
+    parser.add_argument("--keep", action="store_true", help="Keep the working directory (logs, results)")
+    parser.add_argument("--output", help="Also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = SUITES[args.suite](args)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
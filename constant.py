@@ -3,4 +3,113 @@ DRIVER_PATH = "C:/Users/84366/Downloads/chromedriver-win64/chromedriver-win64/ch
 # MAX_PAGE indicates the number of times the page will be scrolled down
 MAX_PAGE = 10
 HEADLESS = True
+# Run channel pages headless too
+HEADLESS_CHANNEL = False
 MAX_THREADS = 5
+
+# Number of warm sub-browsers kept for opening video pages
+SUB_DRIVER_POOL_SIZE = 3
+# A sub-browser is quit and replaced after this many video pages
+SUB_DRIVER_MAX_USES = 20
+
+# Number of threads resolving video pages into media URLs
+RESOLVER_THREADS = 3
+# Max videos waiting to be resolved before the channel walk blocks
+RESOLVER_QUEUE_SIZE = 20
+# Max seconds for a sub-browser to resolve one video page
+TIMEOUT_SUBDRIVER = 30
+
+# Readiness waits poll every POLL_INTERVAL seconds; the timeouts below are only ceilings
+POLL_INTERVAL = 0.2
+CHANNEL_LOAD_TIMEOUT = 10
+SCROLL_WAIT_TIMEOUT = 15
+VIDEO_WAIT_TIMEOUT = 20
+MEDIA_CAPTURE_TIMEOUT = 30
+
+# Browserless (--resolver http) settings
+HTTP_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
+HTTP_RESOLVE_TIMEOUT = 15
+
+# Bytes read per iteration when downloading (1-8 MB works well for large videos)
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+# Number of CDN hosts to keep connection pools for
+DOWNLOAD_POOL_HOSTS = 10
+
+# Files at least DOWNLOAD_SEGMENT_MIN_SIZE bytes are fetched as DOWNLOAD_SEGMENTS parallel ranges
+DOWNLOAD_SEGMENTS = 4
+DOWNLOAD_SEGMENT_MIN_SIZE = 32 * 1024 * 1024
+# How many times an interrupted download is resumed before giving up
+DOWNLOAD_RESUME_RETRIES = 3
+
+# Downloads waiting for a free worker before add_task blocks
+DOWNLOAD_QUEUE_SIZE = 10
+# Max concurrent downloads against a single CDN host
+DOWNLOAD_PER_HOST = 4
+
+# ffmpeg merge workers (None = number of CPU cores)
+MUX_WORKERS = None
+# Merge with "-c copy" when the source codecs fit in .mp4, instead of re-encoding audio
+MUX_STREAM_COPY = True
+# A --stream-merge output whose video and audio durations differ by more than this (seconds)
+# had a leg cut short and is redone via temp files
+STREAM_MERGE_MAX_DRIFT = 2.0
+
+# SQLite store of video states (replaces downloaded.txt, which is imported once)
+STATE_DB_PATH = "state.db"
+# State updates are committed every STATE_FLUSH_INTERVAL seconds or every STATE_BATCH_SIZE updates
+STATE_BATCH_SIZE = 200
+STATE_FLUSH_INTERVAL = 2.0
+
+# Incremental crawl stops scrolling after this many already downloaded videos in a row (--full disables it)
+INCREMENTAL_KNOWN_RUN = 5
+
+# Channels crawled at the same time
+CHANNEL_THREADS = 2
+# Max live Chrome instances (channel pages + video-page resolvers)
+MAX_BROWSERS = 5
+# Browser slots channel pages may never take, so resolvers can always make progress
+RESOLVER_BROWSER_RESERVE = 1
+# Max videos of one channel waiting in the resolver queue
+RESOLVER_QUEUE_PER_CHANNEL = 10
+
+# Resolver browsers skip images/fonts/ads and run with low-memory flags
+RESOLVER_LIGHT_PROFILE = True
+# URL patterns blocked in resolver browsers (must never match /media-video-avc1/ or /media-audio-und-mp4a/)
+RESOLVER_BLOCKED_URLS = [
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*://*.doubleclick.net/*", "*://*.googlesyndication.com/*", "*://*.google-analytics.com/*",
+    "*://*.pglstatp-toutiao.com/*", "*://mcs.snssdk.com/*", "*://mon.toutiao.com/*",
+]
+
+# Resolved media URLs are cached (in STATE_DB_PATH) until they expire
+URL_CACHE_MAX_ENTRIES = 5000
+# Used when a URL carries no expiry parameter
+URL_CACHE_DEFAULT_TTL = 30 * 60
+# Cached URLs are dropped this many seconds before their stated expiry
+URL_CACHE_MARGIN = 5 * 60
+# Query parameters holding a CDN URL's expiry (unix timestamp)
+URL_EXPIRY_PARAMS = ("x-expires", "expires", "expire", "x-expire", "deadline")
+
+# Failed videos are retried with exponential backoff (pending retries persist in STATE_DB_PATH)
+RETRY_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 60
+RETRY_MAX_DELAY = 6 * 60 * 60
+# Minimum seconds between two retries against the same host
+RETRY_HOST_INTERVAL = 2.0
+RETRY_POLL_INTERVAL = 5
+# How long a run keeps going for retries that come due after the crawl; later ones wait for the next run
+RETRY_WAIT_AT_EXIT = 10 * 60
+
+# Port for the local Prometheus /metrics endpoint (None: disabled, see --metrics-port)
+METRICS_PORT = None
+# JSON run summary written at exit (None: disabled)
+RUN_SUMMARY_PATH = "run_summary.json"
+
+# Output files: preallocate .part files from Content-Length (posix_fallocate where available)
+DOWNLOAD_PREALLOCATE = True
+# fsync a .part file (and save its resume progress) every this many bytes
+FSYNC_INTERVAL = 64 * 1024 * 1024
+# Downloads and merges wait while free space on the output volume would drop below this
+DISK_MIN_FREE = 2 * 1024 * 1024 * 1024
+DISK_CHECK_INTERVAL = 10
@@ -1,22 +1,57 @@
 import os
 import re
+import errno
+import shutil
 import subprocess
 import json
 import time
 import requests
+import urllib3
 import argparse
 import threading
 import logging
+import queue
+import random
+import sqlite3
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, unquote, parse_qs
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-
-from constant import DRIVER_PATH, MAX_PAGE, HEADLESS, MAX_THREADS
+from selenium.common.exceptions import TimeoutException
+
+from constant import (
+    DRIVER_PATH, MAX_PAGE, HEADLESS, MAX_THREADS,
+    SUB_DRIVER_POOL_SIZE, SUB_DRIVER_MAX_USES,
+    RESOLVER_THREADS, RESOLVER_QUEUE_SIZE, TIMEOUT_SUBDRIVER,
+    POLL_INTERVAL, CHANNEL_LOAD_TIMEOUT, SCROLL_WAIT_TIMEOUT, VIDEO_WAIT_TIMEOUT, MEDIA_CAPTURE_TIMEOUT,
+    HTTP_USER_AGENT, HTTP_RESOLVE_TIMEOUT,
+    DOWNLOAD_CHUNK_SIZE, DOWNLOAD_POOL_HOSTS,
+    DOWNLOAD_SEGMENTS, DOWNLOAD_SEGMENT_MIN_SIZE, DOWNLOAD_RESUME_RETRIES,
+    DOWNLOAD_QUEUE_SIZE, DOWNLOAD_PER_HOST,
+    MUX_WORKERS, MUX_STREAM_COPY, STREAM_MERGE_MAX_DRIFT,
+    STATE_DB_PATH, STATE_BATCH_SIZE, STATE_FLUSH_INTERVAL,
+    INCREMENTAL_KNOWN_RUN,
+    HEADLESS_CHANNEL, CHANNEL_THREADS, MAX_BROWSERS, RESOLVER_BROWSER_RESERVE, RESOLVER_QUEUE_PER_CHANNEL,
+    RESOLVER_LIGHT_PROFILE, RESOLVER_BLOCKED_URLS,
+    URL_CACHE_MAX_ENTRIES, URL_CACHE_DEFAULT_TTL, URL_CACHE_MARGIN, URL_EXPIRY_PARAMS,
+    RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY, RETRY_HOST_INTERVAL, RETRY_POLL_INTERVAL,
+    RETRY_WAIT_AT_EXIT,
+    METRICS_PORT, RUN_SUMMARY_PATH,
+    DOWNLOAD_PREALLOCATE, FSYNC_INTERVAL, DISK_MIN_FREE, DISK_CHECK_INTERVAL,
+)
 
 # Configure logging
 log_formatter = logging.Formatter(
@@ -38,13 +73,142 @@ file_handler.setLevel(logging.DEBUG)
 file_handler.setFormatter(log_formatter)
 logger.addHandler(file_handler)
 
-# First-time (non-headless) options
+# Channel page options (non-headless unless HEADLESS_CHANNEL=True)
 options_first = webdriver.ChromeOptions()
+if HEADLESS_CHANNEL:
+    options_first.add_argument('--headless')
 
 # Subsequent (headless if HEADLESS=True) options
 options_sub = webdriver.ChromeOptions()
 if HEADLESS:
     options_sub.add_argument('--headless')
+if RESOLVER_LIGHT_PROFILE:
+    # Resolver pages are only read for URLs: skip images and keep the renderer small
+    for arg in (
+        '--blink-settings=imagesEnabled=false', '--mute-audio', '--disable-extensions',
+        '--disable-gpu', '--disable-dev-shm-usage', '--disable-background-networking',
+        '--disable-sync', '--no-first-run', '--renderer-process-limit=2',
+        '--js-flags=--max-old-space-size=256',
+    ):
+        options_sub.add_argument(arg)
+    options_sub.add_experimental_option('prefs', {
+        'profile.managed_default_content_settings.images': 2,
+    })
+
+# Pooled connections for the browserless resolver, shared by per-thread Sessions
+http_adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=RESOLVER_THREADS)
+_http_local = threading.local()
+
+# SSR state embedded in video pages, and media URLs appearing anywhere in the HTML
+RENDER_DATA_RE = re.compile(r'<script[^>]*id="RENDER_DATA"[^>]*>(.*?)</script>', re.S)
+MEDIA_URL_RE = re.compile(r'(?:https?:)?//[^\s"\'<>]+?/media-(?:video-avc1|audio-und-mp4a)/[^\s"\'<>]+')
+PROGRESSIVE_URL_KEYS = ("main_url", "mainUrl", "play_url", "playUrl", "playAddr")
+
+# Injected into every sub-browser page: records the first avc1 video and mp4a
+# audio request made through XHR/fetch in window.__mediaUrls, and blocks any
+# further media requests once both are known, so the page stops downloading
+# the stream we are going to fetch ourselves.
+MEDIA_HOOK_JS = """
+(function () {
+    if (performance.setResourceTimingBufferSize) performance.setResourceTimingBufferSize(2000);
+    var markers = {video: '/media-video-avc1/', audio: '/media-audio-und-mp4a/'};
+    var found = window.__mediaUrls = {video: null, audio: null};
+    function seen(url) {
+        try {
+            url = new URL(String(url), location.href).href;
+        } catch (e) {
+            return false;
+        }
+        var hit = false;
+        for (var kind in markers) {
+            if (url.indexOf(markers[kind]) !== -1) {
+                hit = true;
+                if (!found[kind]) {
+                    found[kind] = url;
+                    return false;
+                }
+            }
+        }
+        return hit && !!(found.video && found.audio);
+    }
+    var open = XMLHttpRequest.prototype.open;
+    XMLHttpRequest.prototype.open = function (method, url) {
+        this.__blocked = seen(url);
+        return open.apply(this, arguments);
+    };
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        if (this.__blocked) {
+            this.abort();
+            return;
+        }
+        return send.apply(this, arguments);
+    };
+    if (window.fetch) {
+        var fetch = window.fetch;
+        window.fetch = function (input) {
+            if (seen(input && input.url ? input.url : input)) {
+                return Promise.reject(new TypeError('media request blocked'));
+            }
+            return fetch.apply(this, arguments);
+        };
+    }
+})();
+"""
+
+# Returns [video_url, audio_url] from the hook, falling back to resource timing
+# entries for requests the hook cannot see (e.g. made from a worker)
+MEDIA_URLS_JS = """
+var found = window.__mediaUrls || {video: null, audio: null};
+var video = found.video, audio = found.audio;
+if (!video || !audio) {
+    var entries = performance.getEntriesByType('resource');
+    for (var i = 0; i < entries.length; i++) {
+        var name = entries[i].name;
+        if (!video && name.indexOf('/media-video-avc1/') !== -1) video = name;
+        if (!audio && name.indexOf('/media-audio-und-mp4a/') !== -1) audio = name;
+    }
+}
+return [video, audio];
+"""
+
+# Sum of bytes transferred by the current page (see ResolveCostStats)
+PAGE_BYTES_JS = """
+var total = 0;
+performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource')).forEach(function (e) {
+    total += e.transferSize || 0;
+});
+return total;
+"""
+
+STOP_MEDIA_JS = """
+document.querySelectorAll('video').forEach(function (v) { v.pause(); v.removeAttribute('src'); v.load(); });
+window.stop();
+"""
+
+# Codecs that can be stream-copied into an .mp4 without re-encoding
+MP4_VIDEO_CODECS = ("h264", "hevc")
+MP4_AUDIO_CODECS = ("aac", "mp3")
+
+# Connection pool shared by all download threads (one pool per CDN host).
+# HostLimiter admits DOWNLOAD_PER_HOST files per host and each may hold
+# DOWNLOAD_SEGMENTS connections; the pool keeps twice that so none of them
+# is discarded on return
+download_adapter = requests.adapters.HTTPAdapter(
+    pool_connections=DOWNLOAD_POOL_HOSTS,
+    pool_maxsize=DOWNLOAD_PER_HOST * max(DOWNLOAD_SEGMENTS, 1) * 2,
+)
+_download_local = threading.local()
+# Runs the audio leg of split-source downloads next to the video leg
+leg_executor = ThreadPoolExecutor(max_workers=MAX_THREADS, thread_name_prefix="AudioLeg")
+# Errors after which a download can be resumed (raw reads raise urllib3 errors directly)
+DOWNLOAD_ERRORS = (requests.RequestException, urllib3.exceptions.HTTPError, IOError)
+
+# Failure reasons, used to decide whether and how a video is retried
+FAIL_TRANSIENT = "transient"
+FAIL_EXPIRED = "expired"
+FAIL_MUX = "mux"
+FAIL_PERMANENT = "permanent"
 
 
 def sanitize_filename(filename):
@@ -78,67 +242,858 @@ def get_channel_url_from_txt(path):
     return urls
 
 
+def get_http_session():
+    # One Session per resolver thread (Sessions are not thread-safe), sharing http_adapter
+    session = getattr(_http_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.headers.update({"User-Agent": HTTP_USER_AGENT, "Referer": "https://www.toutiao.com/"})
+        session.mount("https://", http_adapter)
+        session.mount("http://", http_adapter)
+        _http_local.session = session
+    return session
+
+
+def get_download_session():
+    # One Session per thread (cookies/headers are not thread-safe), all sharing
+    # the same HTTPAdapter so connections to each CDN host are reused
+    session = getattr(_download_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.headers.update({"User-Agent": HTTP_USER_AGENT})
+        session.mount("https://", download_adapter)
+        session.mount("http://", download_adapter)
+        _download_local.session = session
+    return session
+
+
+def _iter_body(r):
+    # Large chunks keep the per-chunk Python overhead (loop, write call) low.
+    # urllib3 returns a new bytes object per read either way, so reading into
+    # a preallocated buffer would only add a copy.
+    for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+        if chunk:
+            metrics.inc("download_bytes_total", len(chunk), source="requests")
+            yield chunk
+
+
+def _pwrite(fd, data, offset, lock):
+    if hasattr(os, "pwrite"):
+        os.pwrite(fd, data, offset)
+        return
+    # Windows has no pwrite: serialize seek + write on the shared descriptor
+    with lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
+
+
+class DownloadFailed(Exception):
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+class RangeIgnored(DownloadFailed):
+    # A server answered a byte-range request with the whole file (200)
+    def __init__(self, message):
+        super().__init__(FAIL_TRANSIENT, message)
+
+
+def classify_status(status):
+    # Signed CDN URLs answer 403/404/410 once they expire; those need a fresh resolve
+    if status in (401, 403, 404, 410):
+        return FAIL_EXPIRED
+    if status in (408, 429) or status >= 500:
+        return FAIL_TRANSIENT
+    return FAIL_PERMANENT
+
+
+def _probe_size(url):
+    """
+    Ask for the first byte to learn the total size and whether the server
+    honours Range requests. Returns (total_size or None, ranges_supported).
+    """
+    with get_download_session().get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=30) as r:
+        if r.status_code == 206:
+            m = re.search(r"/(\d+)$", r.headers.get("Content-Range", ""))
+            return (int(m.group(1)) if m else None), bool(m)
+        if r.status_code == 200:
+            length = r.headers.get("Content-Length")
+            return (int(length) if length else None), r.headers.get("Accept-Ranges") == "bytes"
+        raise DownloadFailed(classify_status(r.status_code), f"Failed to download {url}, status: {r.status_code}")
+
+
+def _preallocate(fd, size):
+    # Reserve the whole file up front, so a full disk fails the download at
+    # once instead of halfway and the file isn't fragmented; filesystems and
+    # platforms without posix_fallocate get a sparse file instead
+    if DOWNLOAD_PREALLOCATE and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+            logger.debug(f"posix_fallocate not supported here: {e}")
+    if os.fstat(fd).st_size != size:
+        os.ftruncate(fd, size)
+
+
+def _fsync_dir(path):
+    # Makes a rename in this directory durable; not possible on Windows
+    if os.name != "posix":
+        return
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        logger.debug(f"Cannot fsync directory of {path}: {e}")
+
+
+def _commit_file(part_path, filepath):
+    # Flush a finished .part file (e.g. written by ffmpeg) and rename it into place
+    fd = os.open(part_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(part_path, filepath)
+    _fsync_dir(filepath)
+
+
+class PartFile:
+    """
+    Output of one download in progress: filepath + ".part", preallocated to
+    the expected size, with the bytes written so far per segment kept in
+    ".part.json". The progress file is written (and fsynced) before the file
+    is preallocated, and afterwards only once the data it counts is fsynced,
+    so after a crash it never claims more than is on disk; a .part without
+    one is started over. commit() renames the finished file into place atomically.
+    """
+
+    def __init__(self, filepath, total, segments=1):
+        self.filepath = filepath
+        self.part_path = filepath + ".part"
+        self.state_path = self.part_path + ".json"
+        self.total = total
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.unsynced = 0
+        self.fd = None
+        self.progress = self._load_progress(segments)
+
+    def _load_progress(self, segments):
+        if not os.path.exists(self.part_path):
+            return [0] * segments
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                if isinstance(saved, list) and len(saved) == segments:
+                    logger.debug(f"Resuming {self.part_path}: {sum(saved)}/{self.total} bytes")
+                    return saved
+            except ValueError:
+                pass
+            return [0] * segments
+        size = os.path.getsize(self.part_path)
+        if segments == 1 and (self.total is None or size < self.total):
+            # Written by an older version without progress file: its size is the progress.
+            # A full-size file is a preallocated one whose progress was never saved.
+            return [size]
+        return [0] * segments
+
+    def space_needed(self):
+        # Bytes the download still has to allocate on disk
+        if self.total is None:
+            return 0
+        existing = os.path.getsize(self.part_path) if os.path.exists(self.part_path) else 0
+        return max(self.total - existing, 0)
+
+    @property
+    def written(self):
+        with self.lock:
+            return sum(self.progress)
+
+    def open(self):
+        self.fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+        # Progress must be on disk before the file grows to full size
+        self._save_progress(list(self.progress))
+        if self.total:
+            _preallocate(self.fd, self.total)
+        return self
+
+    def write(self, idx, offset, data):
+        n = len(data)
+        _pwrite(self.fd, data, offset, self.lock)
+        metrics.inc("bytes_written_total", n, kind="download")
+        with self.lock:
+            self.progress[idx] += n
+            self.unsynced += n
+            due = self.unsynced >= FSYNC_INTERVAL
+        if due:
+            self.sync()
+
+    def reset(self, idx):
+        # The server ignored our Range request: this segment starts over
+        with self.lock:
+            self.progress[idx] = 0
+        if self.total is None:
+            os.ftruncate(self.fd, 0)
+
+    def sync(self):
+        with self.sync_lock:
+            with self.lock:
+                snapshot = list(self.progress)
+                self.unsynced = 0
+            # Everything counted in snapshot has been written; make it durable first
+            os.fsync(self.fd)
+            self._save_progress(snapshot)
+        metrics.inc("fsyncs_total")
+
+    def _save_progress(self, progress):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(progress, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+        _fsync_dir(self.state_path)
+
+    def commit(self):
+        written = self.written
+        if self.total is not None and written != self.total:
+            raise DownloadFailed(
+                FAIL_TRANSIENT,
+                f"Size mismatch for {self.filepath}: got {written}, expected {self.total}; keeping .part for resume"
+            )
+        if self.total is None:
+            os.ftruncate(self.fd, written)
+        os.fsync(self.fd)
+        os.close(self.fd)
+        self.fd = None
+        os.replace(self.part_path, self.filepath)
+        _fsync_dir(self.filepath)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def close(self):
+        if self.fd is not None:
+            try:
+                self.sync()
+            finally:
+                os.close(self.fd)
+                self.fd = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class DiskSpaceGuard:
+    """
+    Blocks writers while free space on the output volume would drop below
+    min_free, which pauses the download queue (its workers wait here)
+    instead of filling a shared disk. Checked again every interval seconds.
+    """
+
+    def __init__(self, min_free, interval):
+        self.min_free = min_free
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.paused = False
+
+    def _set_paused(self, paused, free):
+        with self.lock:
+            if paused == self.paused:
+                return
+            self.paused = paused
+        if paused:
+            metrics.inc("disk_space_pauses_total")
+            logger.warning(f"Low disk space ({free / 1024 ** 3:.1f} GB free), pausing downloads.")
+        else:
+            logger.info(f"Disk space available again ({free / 1024 ** 3:.1f} GB free), resuming downloads.")
+
+    def wait(self, path, needed=0):
+        directory = os.path.dirname(os.path.abspath(path))
+        while True:
+            free = shutil.disk_usage(directory).free
+            if free - needed >= self.min_free:
+                self._set_paused(False, free)
+                return
+            self._set_paused(True, free)
+            time.sleep(self.interval)
+
+
+disk_guard = DiskSpaceGuard(DISK_MIN_FREE, DISK_CHECK_INTERVAL)
+
+
+def is_valid_output(path, expected_size=None):
+    """
+    Whether path holds a complete video rather than one cut short by a crash:
+    its size must match expected_size when known, otherwise ffprobe must read
+    a positive duration from it. Without ffprobe only a non-empty file is required.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return False
+    if expected_size is not None:
+        return size == expected_size
+    if not size:
+        return False
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", path]
+    try:
+        out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError:
+        return True
+    except subprocess.CalledProcessError:
+        return False
+    try:
+        return float(out.stdout.decode("utf-8", "ignore").split()[0]) > 0
+    except (ValueError, IndexError):
+        return False
+
+
+def _download_stream(url, part, resumable):
+    for attempt in range(1, DOWNLOAD_RESUME_RETRIES + 1):
+        offset = part.progress[0] if resumable else 0
+        if part.total is not None and offset == part.total:
+            return True
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with get_download_session().get(url, headers=headers, stream=True, timeout=30) as r:
+                if r.status_code == 206:
+                    logger.debug(f"Resuming {part.part_path} from byte {offset}")
+                elif r.status_code == 200:
+                    part.reset(0)
+                    offset = 0
+                else:
+                    raise DownloadFailed(classify_status(r.status_code),
+                                         f"Failed to download {url}, status: {r.status_code}")
+                for chunk in _iter_body(r):
+                    part.write(0, offset, chunk)
+                    offset += len(chunk)
+            return True
+        except DOWNLOAD_ERRORS as e:
+            logger.warning(f"Download interrupted ({attempt}/{DOWNLOAD_RESUME_RETRIES}) for {part.part_path}: {e}")
+    raise DownloadFailed(FAIL_TRANSIENT, f"Download of {url} interrupted {DOWNLOAD_RESUME_RETRIES} times")
+
+
+def _download_range(url, part, idx, start, end):
+    offset = start + part.progress[idx]
+    if offset > end:
+        return True
+    headers = {"Range": f"bytes={offset}-{end}"}
+    with get_download_session().get(url, headers=headers, stream=True, timeout=30) as r:
+        if r.status_code == 200:
+            raise RangeIgnored(f"Segment #{idx} of {url} got the whole file instead of a range")
+        if r.status_code != 206:
+            raise DownloadFailed(classify_status(r.status_code), f"Segment #{idx} of {url} got status {r.status_code}")
+        for chunk in _iter_body(r):
+            n = len(chunk)
+            if offset + n > end + 1:
+                raise IOError(f"segment #{idx} received more data than requested")
+            part.write(idx, offset, chunk)
+            offset += n
+    return offset == end + 1
+
+
+def _download_segmented(url, part, segments):
+    for attempt in range(1, DOWNLOAD_RESUME_RETRIES + 1):
+        results = [False] * len(segments)
+
+        def run(idx, start, end):
+            try:
+                results[idx] = _download_range(url, part, idx, start, end)
+            except DownloadFailed as e:
+                results[idx] = e
+            except DOWNLOAD_ERRORS as e:
+                logger.warning(f"Segment #{idx} of {part.part_path} interrupted: {e}")
+
+        threads = [
+            threading.Thread(target=run, args=(idx, start, end), name=f"Segment-{idx}")
+            for idx, (start, end) in enumerate(segments)
+        ]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        if all(result is True for result in results):
+            return True
+        for result in results:
+            if isinstance(result, RangeIgnored) or (
+                    isinstance(result, DownloadFailed) and result.reason != FAIL_TRANSIENT):
+                raise result
+        logger.warning(f"Segmented download incomplete ({attempt}/{DOWNLOAD_RESUME_RETRIES}): {part.part_path}")
+    raise DownloadFailed(FAIL_TRANSIENT, f"Segmented download of {url} incomplete")
+
+
 def download_file(url, filepath):
+    """
+    Download url to filepath through a preallocated filepath + ".part" (see
+    PartFile), resuming a previous partial file when the server supports
+    Range. Large files are fetched as DOWNLOAD_SEGMENTS parallel byte ranges.
+    The .part file is only renamed once all expected bytes are written.
+    Returns True on success and raises DownloadFailed (with a failure reason) otherwise.
+    """
     logger.info(f"Downloading to: {filepath}")
     try:
-        # Thêm timeout cho request
-        r = requests.get(url, stream=True, timeout=30)
-        if r.status_code == 200:
-            with open(filepath, "wb") as f:
-                for chunk in r.iter_content(chunk_size=1024):
-                    if chunk:
-                        f.write(chunk)
-            logger.info(f"Downloaded: {filepath}")
+        with host_limiter.limit(url), metrics.timer("download"):
+            return _download_file(url, filepath)
+    except DownloadFailed as e:
+        logger.warning(f"{e} [{e.reason}]")
+        raise
+
+
+def _download_file(url, filepath):
+    try:
+        total, ranges_ok = _probe_size(url)
+        if total is not None and is_valid_output(filepath, total):
+            # Left complete by an earlier run (e.g. a temp leg whose merge never ran)
+            logger.info(f"{filepath} is already complete, skipping download.")
+            return True
+
+        if ranges_ok and total and DOWNLOAD_SEGMENTS > 1 and total >= DOWNLOAD_SEGMENT_MIN_SIZE:
+            seg_size = -(-total // DOWNLOAD_SEGMENTS)
+            segments = [(start, min(start + seg_size, total) - 1) for start in range(0, total, seg_size)]
         else:
-            logger.warning(f"Failed to download {url}, status: {r.status_code}")
+            segments = None
+
+        try:
+            _download_part(url, filepath, total, segments, ranges_ok)
+        except RangeIgnored as e:
+            # The segment progress no longer matches, so the stream starts from byte 0
+            logger.warning(f"{e}, downloading {filepath} as a single stream instead.")
+            _download_part(url, filepath, total, None, False)
+        logger.info(f"Downloaded: {filepath}")
+        return True
+    except DownloadFailed:
+        raise
     except Exception as e:
         logger.error(f"Exception while downloading {url}: {e}")
+        raise DownloadFailed(FAIL_TRANSIENT, str(e)) from e
+
+
+def _download_part(url, filepath, total, segments, resumable):
+    part = PartFile(filepath, total, len(segments) if segments else 1)
+    # Waits (pausing this download slot) until the disk has room for the rest of the file
+    disk_guard.wait(filepath, part.space_needed())
+    with part:
+        if segments:
+            _download_segmented(url, part, segments)
+        else:
+            _download_stream(url, part, resumable)
+        part.commit()
 
 
-def download_merge_cleanup(v_url, a_url, out_file, temp_v, temp_a, use_gpu=False, video_id=None, downloaded_manager=None):
+def _remove_temp_files(*paths):
     try:
-        download_file(v_url, temp_v)
-        download_file(a_url, temp_a)
-        merge_video_audio(temp_v, temp_a, out_file, use_gpu)
-        # After successful download and merge, add to downloaded_manager
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+                logger.debug(f"Removed temporary file: {path}")
+    except Exception as cleanup_error:
+        logger.error(f"Error during cleanup: {cleanup_error}")
+
+
+def _log_io(out_file, mode, network, written, read, network_estimated=False):
+    network = f"~{network} bytes (estimated)" if network_estimated else f"{network} bytes"
+    logger.info(f"I/O for {out_file} [{mode}]: network {network}, disk written {written} bytes, disk read {read} bytes")
+
+
+def _stream_durations(path):
+    """
+    Duration in seconds of each stream in path by codec type, e.g.
+    {"video": 60.0, "audio": 59.9} (None where unknown). Returns None when
+    ffprobe is not installed.
+    """
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "stream=codec_type,duration", "-of", "csv=p=0", path]
+    try:
+        out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError:
+        return None
+    except subprocess.CalledProcessError:
+        return {}
+    durations = {}
+    for line in out.stdout.decode("utf-8", "ignore").splitlines():
+        kind, _, duration = line.strip().partition(",")
+        try:
+            durations.setdefault(kind, float(duration))
+        except ValueError:
+            durations.setdefault(kind, None)
+    return durations
+
+
+def _incomplete_merge(path):
+    # Why a stream-merged file is unusable, or None when it looks complete
+    durations = _stream_durations(path)
+    if durations is None:
+        return None
+    if "video" not in durations or "audio" not in durations:
+        return "missing video or audio stream"
+    video, audio = durations["video"], durations["audio"]
+    if video is not None and audio is not None and abs(video - audio) > STREAM_MERGE_MAX_DRIFT:
+        return f"video {video:.1f}s vs audio {audio:.1f}s"
+    return None
+
+
+def stream_merge(v_url, a_url, out_file):
+    """
+    Let ffmpeg read both legs straight from the CDN and stream-copy them into
+    out_file, so no temp video/audio files touch the disk. ffmpeg can exit 0
+    on a truncated HTTP input, so it runs with -xerror and the result is
+    checked with ffprobe before it is committed. Returns True on success.
+    """
+    part_path = out_file + ".part"
+    headers = f"User-Agent: {HTTP_USER_AGENT}\r\nReferer: https://www.toutiao.com/\r\n"
+    rw_timeout = str(30 * 1000000)
+    cmd = [
+        "ffmpeg", "-y", "-xerror",
+        "-rw_timeout", rw_timeout, "-headers", headers, "-i", v_url,
+        "-rw_timeout", rw_timeout, "-headers", headers, "-i", a_url,
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-c", "copy", "-movflags", "+faststart", "-f", "mp4", part_path
+    ]
+    logger.info(f"Stream merging into: {out_file}")
+    disk_guard.wait(out_file)
+    try:
+        with host_limiter.limit(v_url), metrics.timer("mux", mode="stream"):
+            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        problem = _incomplete_merge(part_path)
+        if problem:
+            logger.warning(f"Stream merge of {out_file} is incomplete ({problem}), falling back to temp files.")
+            _remove_temp_files(part_path)
+            return False
+        _commit_file(part_path, out_file)
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.warning(f"Stream merge failed for {out_file}, falling back to temp files: {e}")
+        _remove_temp_files(part_path)
+        return False
+    size = os.path.getsize(out_file)
+    # ffmpeg does not report the bytes it received per input; stream copy
+    # writes about what it reads, so the output size stands in for them
+    _log_io(out_file, "stream", network=size, written=size, read=0, network_estimated=True)
+    metrics.inc("download_bytes_total", size, source="ffmpeg")
+    metrics.inc("bytes_written_total", size, kind="stream_merge")
+    logger.info(f"Merged successfully (stream): {out_file}")
+    return True
+
+
+def _mark_failed(downloaded_manager, video_id, reason=FAIL_TRANSIENT):
+    if downloaded_manager and video_id:
+        downloaded_manager.mark_failed(video_id, reason)
+
+
+def download_single(url, out_file, video_id=None, downloaded_manager=None):
+    # Only record the video once the file is actually on disk
+    try:
+        download_file(url, out_file)
+    except DownloadFailed as e:
+        _mark_failed(downloaded_manager, video_id, e.reason)
+        return
+    metrics.inc("videos_downloaded_total", mode="single")
+    if downloaded_manager and video_id:
+        downloaded_manager.add_downloaded(video_id, size=os.path.getsize(out_file))
+
+
+def download_merge_cleanup(v_url, a_url, out_file, temp_v, temp_a, use_gpu=False, video_id=None, downloaded_manager=None, use_stream_merge=False):
+    if use_stream_merge and stream_merge(v_url, a_url, out_file):
+        metrics.inc("videos_downloaded_total", mode="stream_merge")
         if downloaded_manager and video_id:
-            downloaded_manager.add_downloaded(video_id)
+            downloaded_manager.add_downloaded(video_id, size=os.path.getsize(out_file))
+        return
+    try:
+        # Fetch the audio leg alongside the video leg
+        audio_future = leg_executor.submit(download_file, a_url, temp_a)
+        error = None
+        try:
+            download_file(v_url, temp_v)
+        except DownloadFailed as e:
+            error = e
+        try:
+            audio_future.result()
+        except DownloadFailed as e:
+            error = error or e
+        if error:
+            logger.warning(f"Skipping merge for {out_file}, download incomplete.")
+            _remove_temp_files(temp_v, temp_a)
+            _mark_failed(downloaded_manager, video_id, error.reason)
+            return
+    except Exception as e:
+        logger.error(f"Error during download: {e}")
+        _remove_temp_files(temp_v, temp_a)
+        _mark_failed(downloaded_manager, video_id)
+        return
+    # Hand the mux to its own pool so this download slot is freed right away
+    mux_pool.submit(merge_and_cleanup, temp_v, temp_a, out_file, use_gpu, video_id, downloaded_manager)
+
+
+def merge_and_cleanup(temp_v, temp_a, out_file, use_gpu=False, video_id=None, downloaded_manager=None):
+    try:
+        temp_size = sum(os.path.getsize(p) for p in (temp_v, temp_a))
+        # The merged file is about as large as both legs together
+        disk_guard.wait(out_file, temp_size)
+        if merge_video_audio(temp_v, temp_a, out_file, use_gpu):
+            out_size = os.path.getsize(out_file)
+            _log_io(out_file, "temp files", network=temp_size, written=temp_size + out_size, read=temp_size)
+            metrics.inc("bytes_written_total", out_size, kind="merge")
+            metrics.inc("videos_downloaded_total", mode="merge")
+            # After successful download and merge, add to downloaded_manager
+            if downloaded_manager and video_id:
+                downloaded_manager.add_downloaded(video_id, size=out_size)
+        else:
+            _mark_failed(downloaded_manager, video_id, FAIL_MUX)
     except Exception as e:
-        logger.error(f"Error during download and merge: {e}")
+        logger.error(f"Error during merge: {e}")
+        _mark_failed(downloaded_manager, video_id, FAIL_MUX)
     finally:
-        try:
-            if os.path.exists(temp_v):
-                os.remove(temp_v)
-                logger.debug(f"Removed temporary video file: {temp_v}")
-            if os.path.exists(temp_a):
-                os.remove(temp_a)
-                logger.debug(f"Removed temporary audio file: {temp_a}")
-        except Exception as cleanup_error:
-            logger.error(f"Error during cleanup: {cleanup_error}")
+        _remove_temp_files(temp_v, temp_a)
+
+
+def _probe_codec(path, stream):
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", stream,
+        "-show_entries", "stream=codec_name", "-of", "default=nw=1:nk=1", path
+    ]
+    try:
+        out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return out.stdout.decode("utf-8", "ignore").strip().splitlines()[0]
+    except (subprocess.CalledProcessError, OSError, IndexError) as e:
+        logger.debug(f"ffprobe failed for {path}: {e}")
+        return None
+
+
+def can_stream_copy(video_path, audio_path):
+    # Stream copy into .mp4 only works for codecs the container accepts as-is
+    return (_probe_codec(video_path, "v:0") in MP4_VIDEO_CODECS
+            and _probe_codec(audio_path, "a:0") in MP4_AUDIO_CODECS)
 
 
 def merge_video_audio(video_path, audio_path, output_path, use_gpu=False):
     logger.info(f"Merging video: {video_path} + audio: {audio_path} -> {output_path}")
+    # ffmpeg writes a .part file that is only renamed to output_path once complete
+    part_path = output_path + ".part"
+    output_args = ["-y", "-f", "mp4", part_path]
+    cmd_copy = [
+        "ffmpeg", "-i", video_path, "-i", audio_path,
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-c", "copy", "-movflags", "+faststart"
+    ] + output_args
     rmd_gpu = [
         "ffmpeg", "-hwaccel", "cuda", "-i", video_path, "-i", audio_path,
-        "-c:v", "h264_nvenc", "-preset", "fast", "-c:a", "aac", "-b:a", "192k", output_path
-    ]
+        "-c:v", "h264_nvenc", "-preset", "fast", "-c:a", "aac", "-b:a", "192k"
+    ] + output_args
     cmd_cpu = [
         "ffmpeg", "-i", video_path, "-i", audio_path,
-        "-c:v", "copy", "-c:a", "aac", "-strict", "experimental", output_path
-    ]
+        "-c:v", "copy", "-c:a", "aac", "-strict", "experimental"
+    ] + output_args
+    if MUX_STREAM_COPY and can_stream_copy(video_path, audio_path):
+        try:
+            subprocess.run(cmd_copy, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            _commit_file(part_path, output_path)
+            logger.info(f"Merged successfully (stream copy): {output_path}")
+            return True
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"Stream copy failed, re-encoding instead: {e}")
     cmd = rmd_gpu if use_gpu else cmd_cpu
     try:
         subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _commit_file(part_path, output_path)
         logger.info(f"Merged successfully: {output_path}")
+        return True
     except subprocess.CalledProcessError as e:
         logger.error(f"Merge error: {e}")
+        _remove_temp_files(part_path)
+        return False
+
+
+class Metrics:
+    """
+    Run-wide per-stage timings, counters and gauges. Served in Prometheus
+    text format by the optional /metrics endpoint (--metrics-port) and
+    written as a JSON run summary at exit. Labels are passed as keyword
+    arguments, e.g. metrics.inc("videos_failed_total", reason="expired").
+    """
+
+    PREFIX = "toutiao_"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        # (stage, labels) -> [count, total seconds, max seconds]
+        self.timings = {}
+        # (name, labels) -> value
+        self.counters = {}
+        # name -> callable returning the current value
+        self.gauges = {}
+        # name -> highest value reported so far
+        self.peaks = {}
+
+    def observe(self, stage, seconds, **labels):
+        key = (stage, tuple(sorted(labels.items())))
+        with self.lock:
+            timing = self.timings.setdefault(key, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.time() - start, **labels)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, read):
+        self.gauges[name] = read
+
+    def peak(self, name, value):
+        # Gauge that keeps the highest value reported, e.g. peak browser RSS
+        with self.lock:
+            self.peaks[name] = max(self.peaks.get(name, 0), value)
+
+    def timings_for(self, stage):
+        # {labels: (count, total seconds, max seconds)} for one stage
+        with self.lock:
+            return {labels: tuple(value) for (name, labels), value in self.timings.items() if name == stage}
+
+    def counters_for(self, name):
+        # {labels: value} for one counter
+        with self.lock:
+            return {labels: value for (key, labels), value in self.counters.items() if key == name}
+
+    def peak_value(self, name):
+        with self.lock:
+            return self.peaks.get(name, 0)
+
+    def _snapshot(self):
+        with self.lock:
+            timings = {key: list(value) for key, value in self.timings.items()}
+            counters = dict(self.counters)
+            gauges = dict(self.peaks)
+        for name, read in list(self.gauges.items()):
+            try:
+                gauges[name] = read()
+            except Exception as e:
+                logger.debug(f"Cannot read gauge {name}: {e}")
+        return timings, counters, gauges
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+    @staticmethod
+    def _key(name, labels):
+        # Summary keys look like "resolve[backend=http]"
+        if not labels:
+            return name
+        return name + "[" + ",".join(f"{k}={v}" for k, v in labels) + "]"
+
+    def render_prometheus(self):
+        timings, counters, gauges = self._snapshot()
+        p = self.PREFIX
+        lines = [f"# TYPE {p}stage_seconds summary"]
+        for (stage, labels), (count, total, _) in sorted(timings.items()):
+            lbl = self._labels((("stage", stage),) + labels)
+            lines.append(f"{p}stage_seconds_count{lbl} {count}")
+            lines.append(f"{p}stage_seconds_sum{lbl} {total:.6f}")
+        lines.append(f"# TYPE {p}stage_seconds_max gauge")
+        for (stage, labels), (_, _, peak) in sorted(timings.items()):
+            lines.append(f"{p}stage_seconds_max{self._labels((('stage', stage),) + labels)} {peak:.6f}")
+        declared = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in declared:
+                lines.append(f"# TYPE {p}{name} counter")
+                declared.add(name)
+            lines.append(f"{p}{name}{self._labels(labels)} {value}")
+        for name, value in sorted(gauges.items()):
+            lines.append(f"# TYPE {p}{name} gauge")
+            lines.append(f"{p}{name} {value}")
+        lines.append(f"# TYPE {p}uptime_seconds gauge")
+        lines.append(f"{p}uptime_seconds {time.time() - self.started:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        timings, counters, gauges = self._snapshot()
+        elapsed = time.time() - self.started
+        stages = {}
+        for (stage, labels), (count, total, peak) in sorted(timings.items()):
+            stages[self._key(stage, labels)] = {
+                "count": count,
+                "total_seconds": round(total, 3),
+                "avg_seconds": round(total / count, 3),
+                "max_seconds": round(peak, 3),
+            }
+        counter_values = {self._key(name, labels): value for (name, labels), value in sorted(counters.items())}
+        download_bytes = sum(value for (name, _), value in counters.items() if name == "download_bytes_total")
+        return {
+            "started_at": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "elapsed_seconds": round(elapsed, 3),
+            "download_bytes_per_second": round(download_bytes / elapsed, 1) if elapsed else 0,
+            "stages": stages,
+            "counters": counter_values,
+            "gauges": gauges,
+        }
+
+    def write_summary(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        logger.info(f"Run summary written to {path}")
+
+
+metrics = Metrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Metrics request: {format % args}")
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    # Local only; serves metrics.render_prometheus() on /metrics
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="Metrics", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+    return server
 
 
 class TaskQueue:
-    def __init__(self, max_threads):
-        self.semaphore = threading.Semaphore(max_threads)
+    """
+    Runs tasks on a fixed set of worker threads. add_task blocks once
+    max_threads tasks are running and max_pending more are waiting;
+    wait_completion blocks until every added task has finished.
+    """
+
+    def __init__(self, max_threads, max_pending=0):
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="Worker")
+        self.slots = threading.BoundedSemaphore(max_threads + max_pending)
         self.lock = threading.Lock()
+        self.all_done = threading.Condition(self.lock)
+        self.unfinished = 0
 
     def worker(self, func, args, kwargs):
         try:
@@ -148,61 +1103,562 @@ class TaskQueue:
         except Exception as e:
             logger.error(f"Error in task {func.__name__} with args {args} and kwargs {kwargs}: {e}")
         finally:
-            self.semaphore.release()
+            self.slots.release()
+            with self.all_done:
+                self.unfinished -= 1
+                if self.unfinished == 0:
+                    self.all_done.notify_all()
 
     def add_task(self, func, *args, **kwargs):
-        self.semaphore.acquire()
-        thread = threading.Thread(
-            target=self.worker, 
-            args=(func, args, kwargs), 
-            name=f"Worker-{int(time.time()*1000)}"
-        )
-        thread.daemon = True
-        thread.start()
-        logger.debug(f"Started new thread: {thread.name}")
+        self.slots.acquire()
+        with self.lock:
+            self.unfinished += 1
+        self.executor.submit(self.worker, func, args, kwargs)
+        logger.debug(f"Queued task: {func.__name__}")
 
     def wait_completion(self):
-        # Wait until all semaphore permits are released
-        while self.semaphore._value < self.semaphore._initial_value:
-            time.sleep(1)
+        with self.all_done:
+            while self.unfinished:
+                self.all_done.wait()
         logger.debug("All tasks have been completed.")
 
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
 
-class DownloadedManager:
-    def __init__(self, filepath):
-        self.filepath = filepath
-        self.downloaded_ids = set()
+
+class HostLimiter:
+    """
+    Caps the number of concurrent downloads per CDN host.
+    """
+
+    def __init__(self, per_host):
+        self.per_host = per_host
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def limit(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            semaphore = self.semaphores.get(host)
+            if semaphore is None:
+                semaphore = self.semaphores[host] = threading.BoundedSemaphore(self.per_host)
+        with semaphore:
+            yield
+
+
+host_limiter = HostLimiter(DOWNLOAD_PER_HOST)
+
+
+class MuxPool:
+    """
+    Runs ffmpeg merges on their own workers, separate from the download
+    threads. Each job is an ffmpeg process, so the pool is sized to the
+    CPU cores rather than MAX_THREADS.
+    """
+
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Mux")
         self.lock = threading.Lock()
-        self._load_downloaded()
+        self.all_done = threading.Condition(self.lock)
+        self.pending = 0
+
+    def queue_depth(self):
+        with self.lock:
+            return self.pending
+
+    def _run(self, func, args):
+        start = time.time()
+        try:
+            func(*args)
+        except Exception as e:
+            logger.error(f"Error in mux job {func.__name__}: {e}")
+        finally:
+            elapsed = time.time() - start
+            metrics.observe("mux", elapsed, mode="temp_files")
+            with self.lock:
+                self.pending -= 1
+                depth = self.pending
+                if not depth:
+                    self.all_done.notify_all()
+            logger.debug(f"Mux job took {elapsed:.1f}s, {depth} still queued.")
+
+    def submit(self, func, *args):
+        with self.lock:
+            self.pending += 1
+            depth = self.pending
+        self.executor.submit(self._run, func, args)
+        logger.debug(f"Queued mux job, queue depth: {depth}")
+
+    def wait_completion(self):
+        with self.all_done:
+            while self.pending:
+                self.all_done.wait()
 
-    def _load_downloaded(self):
-        if os.path.exists(self.filepath):
+    def shutdown(self):
+        # Waits for all queued merges to finish
+        self.executor.shutdown(wait=True)
+        jobs, total, peak = metrics.timings_for("mux").get((("mode", "temp_files"),), (0, 0.0, 0.0))
+        if jobs:
+            logger.info(f"Mux: {jobs} jobs, avg {total / jobs:.1f}s, max {peak:.1f}s")
+
+
+mux_pool = MuxPool(MUX_WORKERS or os.cpu_count() or 1)
+
+
+class WaitStats:
+    """
+    Collects how long each readiness wait actually took, so it can be
+    compared with the fixed sleeps used before. Recorded as the "wait"
+    stage in metrics, labelled by kind.
+    """
+
+    def record(self, stage, seconds):
+        metrics.observe("wait", seconds, kind=stage)
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(stage, time.time() - start)
+
+    def log_summary(self):
+        for labels, (count, total, _) in sorted(metrics.timings_for("wait").items()):
+            stage = dict(labels)["kind"]
+            logger.info(f"Wait [{stage}]: {count} waits, total {total:.1f}s, avg {total / count:.2f}s")
+
+
+wait_stats = WaitStats()
+
+
+class BrowserBudget:
+    """
+    Caps the number of live Chrome instances shared by channel pages and
+    video-page resolvers. Channel pages may never take the last
+    resolver_reserve slots, so resolvers can always drain the queue the
+    channel walks are blocked on. When no slot is free, registered
+    reclaimers (e.g. SubDriverPool.trim_idle) are asked to quit an idle browser.
+    """
+
+    def __init__(self, max_browsers, resolver_reserve):
+        self.max_browsers = max_browsers
+        self.max_channels = max(1, max_browsers - resolver_reserve)
+        self.cond = threading.Condition()
+        self.live = 0
+        self.live_channels = 0
+        self.reclaimers = []
+
+    def add_reclaimer(self, reclaim):
+        self.reclaimers.append(reclaim)
+
+    def _available(self, kind):
+        if self.live >= self.max_browsers:
+            return False
+        return kind != "channel" or self.live_channels < self.max_channels
+
+    def acquire(self, kind):
+        while True:
+            with self.cond:
+                if self._available(kind):
+                    self.live += 1
+                    if kind == "channel":
+                        self.live_channels += 1
+                    return
+            # Quit an idle browser outside the lock (quitting releases its slot)
+            if not any(reclaim() for reclaim in self.reclaimers):
+                with self.cond:
+                    if not self._available(kind):
+                        self.cond.wait(1)
+
+    def release(self, kind):
+        with self.cond:
+            self.live -= 1
+            if kind == "channel":
+                self.live_channels -= 1
+            self.cond.notify_all()
+
+
+browser_budget = BrowserBudget(MAX_BROWSERS, RESOLVER_BROWSER_RESERVE)
+
+
+class SubDriverPool:
+    """
+    Bounded pool of warm sub-browsers used to open video pages.
+    Each driver is leased for one video page, reset on return and
+    replaced after max_uses pages or after it crashed.
+    """
+
+    def __init__(self, size, max_uses):
+        self.size = size
+        self.max_uses = max_uses
+        self.semaphore = threading.BoundedSemaphore(size)
+        self.idle = queue.LifoQueue()
+        self.uses = {}
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def _create_driver(self):
+        logger.debug("Launching new sub-browser for the pool.")
+        browser_budget.acquire("resolver")
+        try:
+            with metrics.timer("browser_start", kind="resolver"):
+                driver = webdriver.Chrome(service=Service(DRIVER_PATH), options=options_sub)
+        except Exception:
+            browser_budget.release("resolver")
+            raise
+        driver.execute_cdp_cmd("Network.enable", {})
+        # Installed once, runs on every page this driver opens
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": MEDIA_HOOK_JS})
+        if RESOLVER_LIGHT_PROFILE:
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": RESOLVER_BLOCKED_URLS})
+        with self.lock:
+            self.uses[id(driver)] = 0
+        return driver
+
+    def _quit_driver(self, driver):
+        with self.lock:
+            self.uses.pop(id(driver), None)
+        try:
+            driver.quit()
+            logger.debug("Sub-browser quit.")
+        except Exception as e:
+            logger.debug(f"Error quitting sub-browser: {e}")
+        finally:
+            browser_budget.release("resolver")
+
+    def trim_idle(self):
+        # Quit one idle browser to free a slot in the browser budget
+        try:
+            driver = self.idle.get_nowait()
+        except queue.Empty:
+            return False
+        self._quit_driver(driver)
+        return True
+
+    def _reset_driver(self, driver):
+        # Stop the current page (and its media stream), then drop the cookies of
+        # every domain; delete_all_cookies() would only cover about:blank
+        driver.get("about:blank")
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+
+    def acquire(self):
+        self.semaphore.acquire()
+        try:
+            if self.closed:
+                raise RuntimeError("Sub-driver pool is shut down")
+            try:
+                return self.idle.get_nowait()
+            except queue.Empty:
+                return self._create_driver()
+        except Exception:
+            self.semaphore.release()
+            raise
+
+    def release(self, driver, broken=False):
+        try:
+            with self.lock:
+                self.uses[id(driver)] = self.uses.get(id(driver), 0) + 1
+                uses = self.uses[id(driver)]
+            if broken or self.closed or uses >= self.max_uses:
+                logger.debug(f"Recycling sub-browser (broken={broken}, uses={uses}).")
+                self._quit_driver(driver)
+                return
             try:
-                with open(self.filepath, "r", encoding="utf-8") as f:
-                    for line in f:
-                        video_id = line.strip()
-                        if video_id:
-                            self.downloaded_ids.add(video_id)
-                logger.debug(f"Loaded {len(self.downloaded_ids)} downloaded video IDs.")
+                self._reset_driver(driver)
             except Exception as e:
-                logger.error(f"Error loading downloaded IDs from {self.filepath}: {e}")
-        else:
-            logger.debug(f"No existing downloaded file found at {self.filepath}.")
+                logger.warning(f"Sub-browser reset failed, recycling: {e}")
+                self._quit_driver(driver)
+                return
+            self.idle.put(driver)
+        finally:
+            self.semaphore.release()
+
+    @contextmanager
+    def lease(self):
+        driver = self.acquire()
+        broken = False
+        try:
+            yield driver
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.release(driver, broken=broken)
+
+    def shutdown(self):
+        self.closed = True
+        count = 0
+        while True:
+            try:
+                driver = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit_driver(driver)
+            count += 1
+        logger.debug(f"Sub-driver pool drained, {count} browsers quit.")
+
+
+class DownloadStateStore:
+    """
+    SQLite (WAL mode) store of every video seen, keyed by video_id, with its
+    status (discovered/resolved/downloaded/failed) and metadata. Updates are
+    buffered in memory and committed in batches by a background writer thread.
+    The legacy downloaded.txt is imported once on first use.
+    """
+
+    STATUSES = ("discovered", "resolved", "downloaded", "failed")
+    # Statuses that end a video's trip through the pipeline
+    FINAL_STATUSES = ("downloaded", "failed")
+    # Columns kept as-is when an update does not set them
+    OPTIONAL_COLUMNS = ("channel_token", "title", "publish_date", "href", "size",
+                        "attempts", "fail_reason", "next_retry_at")
+
+    def __init__(self, db_path, legacy_path=None, batch_size=STATE_BATCH_SIZE, flush_interval=STATE_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self._local = threading.local()
+        self.final_listeners = []
+
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                channel_token TEXT,
+                title TEXT,
+                publish_date TEXT,
+                size INTEGER,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        # Columns added after the first release of the store
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(videos)")}
+        for column, decl in (("href", "TEXT"), ("attempts", "INTEGER"), ("fail_reason", "TEXT"),
+                             ("next_retry_at", "REAL")):
+            if column not in existing:
+                conn.execute(f"ALTER TABLE videos ADD COLUMN {column} {decl}")
+        conn.execute("CREATE INDEX IF NOT EXISTS videos_next_retry ON videos (next_retry_at) WHERE next_retry_at > 0")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS channels (
+                channel_token TEXT PRIMARY KEY,
+                last_video_id TEXT,
+                last_publish_date TEXT,
+                crawled_at REAL NOT NULL
+            )
+        """)
+        conn.commit()
+        if legacy_path:
+            self._import_legacy(conn, legacy_path)
+
+        self.writer = threading.Thread(target=self._writer_loop, name="StateWriter")
+        self.writer.daemon = True
+        self.writer.start()
+
+    def _connect(self):
+        # One connection per thread; WAL lets readers run while the writer commits
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _import_legacy(self, conn, legacy_path):
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_imported'").fetchone():
+            return
+        if not os.path.exists(legacy_path):
+            logger.debug(f"No existing downloaded file found at {legacy_path}.")
+            return
+        now = time.time()
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                rows = ((line.strip(), now, now) for line in f if line.strip())
+                conn.executemany(
+                    "INSERT OR IGNORE INTO videos (video_id, status, created_at, updated_at) "
+                    "VALUES (?, 'downloaded', ?, ?)",
+                    rows
+                )
+            conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_imported', ?)", (legacy_path,))
+            conn.commit()
+            count = conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+            logger.info(f"Imported downloaded IDs from {legacy_path}, {count} videos in state store.")
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error importing downloaded IDs from {legacy_path}: {e}")
+
+    def update(self, video_id, status, **fields):
+        if status not in self.STATUSES:
+            raise ValueError(f"Unknown status: {status}")
+        with self.lock:
+            row = self.pending.setdefault(video_id, {"created_at": time.time()})
+            # Same rule as the upsert in _flush: a downloaded video never goes back
+            if row.get("status") == "downloaded" and status != "downloaded":
+                logger.debug(f"Ignoring status {status} for downloaded video {video_id}")
+                return
+            row.update({k: v for k, v in fields.items() if v is not None})
+            row["status"] = status
+            row["updated_at"] = time.time()
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.wakeup.set()
+        if status in self.FINAL_STATUSES:
+            for listener in self.final_listeners:
+                listener(video_id)
+
+    def add_final_listener(self, listener):
+        # listener(video_id) is called whenever a video becomes downloaded or failed
+        self.final_listeners.append(listener)
 
     def is_downloaded(self, video_id):
         with self.lock:
-            return video_id in self.downloaded_ids
+            row = self.pending.get(video_id)
+            if row and row["status"] == "downloaded":
+                return True
+        found = self._connect().execute(
+            "SELECT 1 FROM videos WHERE video_id = ? AND status = 'downloaded'", (video_id,)
+        ).fetchone()
+        return found is not None
+
+    def add_downloaded(self, video_id, size=None):
+        self.update(video_id, "downloaded", size=size)
+        logger.debug(f"Marked video ID as downloaded: {video_id}")
+
+    def _row(self, video_id, *columns):
+        with self.lock:
+            row = self.pending.get(video_id)
+            if row and all(col in row for col in columns):
+                return tuple(row[col] for col in columns)
+        found = self._connect().execute(
+            f"SELECT {', '.join(columns)} FROM videos WHERE video_id = ?", (video_id,)
+        ).fetchone()
+        if found is None:
+            return (None,) * len(columns)
+        if row:
+            found = tuple(row.get(col, value) for col, value in zip(columns, found))
+        return found
+
+    def mark_failed(self, video_id, reason):
+        """
+        Record a failure and schedule the next retry with exponential backoff
+        and jitter. Permanent failures, and videos that used up
+        RETRY_MAX_ATTEMPTS, are not rescheduled (next_retry_at = 0).
+        """
+        metrics.inc("videos_failed_total", reason=reason)
+        attempts = (self._row(video_id, "attempts")[0] or 0) + 1
+        next_retry_at = 0
+        if reason != FAIL_PERMANENT and attempts < RETRY_MAX_ATTEMPTS:
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1))
+            next_retry_at = time.time() + delay * random.uniform(0.5, 1.5)
+            logger.info(f"Video {video_id} failed ({reason}), retry #{attempts} in {next_retry_at - time.time():.0f}s")
+        else:
+            logger.warning(f"Video {video_id} failed ({reason}) after {attempts} attempts, giving up.")
+        self.update(video_id, "failed", attempts=attempts, fail_reason=reason, next_retry_at=next_retry_at)
+
+    def is_retry_pending(self, video_id):
+        status, next_retry_at = self._row(video_id, "status", "next_retry_at")
+        return status == "failed" and bool(next_retry_at)
+
+    def is_given_up(self, video_id):
+        # Failed permanently or out of attempts: no retry will ever be scheduled
+        status, next_retry_at = self._row(video_id, "status", "next_retry_at")
+        return status == "failed" and not next_retry_at
+
+    def due_retries(self, now, limit=100):
+        # Retries whose backoff has elapsed, oldest first
+        self.flush()
+        return self._connect().execute(
+            "SELECT video_id, title, href, publish_date, channel_token, fail_reason FROM videos "
+            "WHERE status = 'failed' AND next_retry_at > 0 AND next_retry_at <= ? "
+            "ORDER BY next_retry_at LIMIT ?",
+            (now, limit)
+        ).fetchall()
+
+    def next_retry_time(self):
+        self.flush()
+        row = self._connect().execute(
+            "SELECT MIN(next_retry_at) FROM videos WHERE status = 'failed' AND next_retry_at > 0"
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_channel_state(self, channel_token):
+        # (newest video_id, its publish date) seen on the last crawl, or (None, None)
+        row = self._connect().execute(
+            "SELECT last_video_id, last_publish_date FROM channels WHERE channel_token = ?", (channel_token,)
+        ).fetchone()
+        return row if row else (None, None)
+
+    def set_channel_state(self, channel_token, video_id, publish_date):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO channels (channel_token, last_video_id, last_publish_date, crawled_at) "
+            "VALUES (?, ?, ?, ?)",
+            (channel_token, video_id, publish_date, time.time())
+        )
+        conn.commit()
+
+    def flush(self):
+        # flush_lock keeps batches committing in the order they were taken
+        with self.flush_lock:
+            self._flush()
 
-    def add_downloaded(self, video_id):
+    def _flush(self):
         with self.lock:
-            if video_id not in self.downloaded_ids:
-                self.downloaded_ids.add(video_id)
-                try:
-                    with open(self.filepath, "a", encoding="utf-8") as f:
-                        f.write(f"{video_id}\n")
-                    logger.debug(f"Added video ID to downloaded list: {video_id}")
-                except Exception as e:
-                    logger.error(f"Error writing video ID {video_id} to {self.filepath}: {e}")
+            batch, self.pending = self.pending, {}
+        if not batch:
+            return
+        rows = [
+            (video_id, row["status"]) + tuple(row.get(col) for col in self.OPTIONAL_COLUMNS)
+            + (row["created_at"], row["updated_at"])
+            for video_id, row in batch.items()
+        ]
+        columns = ", ".join(self.OPTIONAL_COLUMNS)
+        placeholders = ", ".join("?" * (len(self.OPTIONAL_COLUMNS) + 4))
+        updates = ",\n".join(f"{col} = COALESCE(excluded.{col}, videos.{col})" for col in self.OPTIONAL_COLUMNS)
+        conn = self._connect()
+        try:
+            # A downloaded video never goes back to an earlier status
+            conn.executemany(f"""
+                INSERT INTO videos (video_id, status, {columns}, created_at, updated_at)
+                VALUES ({placeholders})
+                ON CONFLICT(video_id) DO UPDATE SET
+                    status = excluded.status,
+                    {updates},
+                    updated_at = excluded.updated_at
+                WHERE videos.status != 'downloaded' OR excluded.status = 'downloaded'
+            """, rows)
+            conn.commit()
+            logger.debug(f"Committed {len(rows)} state updates.")
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error committing {len(rows)} state updates to {self.db_path}: {e}")
+            # Put the batch back unless newer updates arrived meanwhile
+            with self.lock:
+                for video_id, row in batch.items():
+                    self.pending.setdefault(video_id, row)
+
+    def _writer_loop(self):
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+        self.flush()
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+        self.writer.join()
+        logger.debug("State store closed.")
 
 
 def extract_video_id(url):
@@ -222,276 +1678,1005 @@ def extract_video_id(url):
     return None
 
 
-def scrape_sub_driver(href, use_gpu=False):
+def _height_changed(driver, last_height):
+    new_height = driver.execute_script("return document.body.scrollHeight")
+    return new_height if new_height != last_height else False
+
+
+def scrape_sub_driver(href, driver_pool):
+    # 1) Lease a warm sub-browser (can be headless or not) to find src
+    logger.info("Opening video page to find source URLs...")
+    with driver_pool.lease() as sub_driver:
+        try:
+            return _scrape_page(sub_driver, href)
+        finally:
+            resolve_cost_stats.record_driver(sub_driver)
+
+
+def _scrape_page(sub_driver, href):
     result = {"video_src": None, "v_url": None, "a_url": None}
 
-    sub_driver = None
+    sub_driver.get(href)
+    logger.debug("Opened video URL in sub-browser.")
+
+    # 2) Đợi đến khi xuất hiện <video> (VIDEO_WAIT_TIMEOUT chỉ là mức trần)
+    try:
+        with wait_stats.measure("video_element"):
+            WebDriverWait(sub_driver, VIDEO_WAIT_TIMEOUT, poll_frequency=POLL_INTERVAL).until(
+                EC.presence_of_element_located((By.XPATH, '//*[@id="root"]/div/div[2]/div[1]/div/div[1]/ul/li[2]/div/video'))
+            )
+        logger.debug("Video element found on the page.")
+    except Exception as e:
+        logger.warning(f"Video element not found: {e}")
+        return result  # Trả về rỗng
+
+    # 3) Thử tìm single source (video_src)
     try:
-        # 1) Open a second webdriver (can be headless or not) to find src
-        options_sub.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        vid_el = sub_driver.find_element(
+            By.XPATH,
+            '//*[@id="root"]/div/div[2]/div[1]/div/div[1]/ul/li[2]/div/video'
+        )
+        video_src = vid_el.get_attribute("src")
+        logger.debug(f"Single video src found: {video_src}")
+    except Exception as e:
+        logger.warning(f"Cannot find <video> element or src: {e}")
+        video_src = None
+
+    if video_src and not video_src.startswith("blob:"):
+        # Single-source detected
+        logger.info(f"Single-source detected: {video_src}")
+        result["video_src"] = video_src
+        sub_driver.execute_script(STOP_MEDIA_JS)
+        return result
 
-        logger.info("Opening video page to find source URLs...")
-        sub_driver = webdriver.Chrome(service=Service(DRIVER_PATH), options=options_sub)
-        sub_driver.execute_cdp_cmd("Network.enable", {})
-        sub_driver.get(href)
-        logger.debug("Opened video URL in sub-browser.")
-        time.sleep(5)
+    # 4) Nếu là splitted source, đọc URL mà MEDIA_HOOK_JS đã ghi lại trong trang
+    logger.info("Splitted source suspected, checking captured requests...")
+    v_url, a_url = None, None
+    start_t = time.time()
+    while True:
+        v_url, a_url = sub_driver.execute_script(MEDIA_URLS_JS)
+        if v_url and a_url:
+            logger.info(f"Video URL: {v_url}")
+            logger.info(f"Audio URL: {a_url}")
+            result["v_url"] = v_url
+            result["a_url"] = a_url
+            # URLs are known: stop the page's own media download
+            sub_driver.execute_script(STOP_MEDIA_JS)
+            break
+        if time.time() - start_t > MEDIA_CAPTURE_TIMEOUT:
+            logger.warning("Timeout: could not find splitted source URLs.")
+            break
+        time.sleep(POLL_INTERVAL)
+    wait_stats.record("media_requests", time.time() - start_t)
+
+    return result
+
+
+class VideoRecord:
+    __slots__ = ("video_id", "title", "href", "publish_time", "out_file", "temp_dir", "channel_token")
+
+    def __init__(self, video_id, title, href, publish_time, out_file, temp_dir, channel_token=None):
+        self.video_id = video_id
+        self.title = title
+        self.href = href
+        self.publish_time = publish_time
+        self.out_file = out_file
+        self.temp_dir = temp_dir
+        self.channel_token = channel_token
+
+
+def _find_media_urls(node, found):
+    # Walk the page state JSON and collect the first URL of each kind
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if isinstance(value, str) and key in PROGRESSIVE_URL_KEYS:
+                url = _normalize_media_url(value)
+                if url and "/media-audio-" not in url and "/media-video-" not in url:
+                    found.setdefault("video_src", url)
+            _find_media_urls(value, found)
+    elif isinstance(node, list):
+        for value in node:
+            _find_media_urls(value, found)
+    elif isinstance(node, str):
+        url = _normalize_media_url(node)
+        if url and "/media-video-avc1/" in url:
+            found.setdefault("v_url", url)
+        elif url and "/media-audio-und-mp4a/" in url:
+            found.setdefault("a_url", url)
+
+
+def _normalize_media_url(value):
+    if value.startswith("//"):
+        value = "https:" + value
+    return value if value.startswith("http") else None
+
+
+def parse_video_page(html):
+    """
+    Extract media URLs from the SSR state embedded in a video page.
+    Returns the same dict as scrape_sub_driver; all values are None
+    when nothing usable was found.
+    """
+    result = {"video_src": None, "v_url": None, "a_url": None}
+    found = {}
 
-        # 2) Đợi đến khi xuất hiện <video>
+    for m in RENDER_DATA_RE.finditer(html):
+        raw = m.group(1).strip()
         try:
-            WebDriverWait(sub_driver, 20).until(
-                EC.presence_of_element_located((By.XPATH, '//*[@id="root"]/div/div[2]/div[1]/div/div[1]/ul/li[2]/div/video'))
-            )
-            logger.debug("Video element found on the page.")
-        except Exception as e:
-            logger.warning(f"Video element not found: {e}")
-            return result  # Trả về rỗng
+            state = json.loads(unquote(raw) if raw.startswith("%") else raw)
+        except ValueError as e:
+            logger.debug(f"Cannot parse embedded page state: {e}")
+            continue
+        _find_media_urls(state, found)
+
+    # Fallback: split-source URLs written directly into the HTML (often with escaped slashes)
+    if not ("v_url" in found and "a_url" in found):
+        text = html.replace("\\u002F", "/").replace("\\/", "/")
+        for url in MEDIA_URL_RE.findall(text):
+            _find_media_urls(url, found)
+
+    if "v_url" in found and "a_url" in found:
+        result["v_url"] = found["v_url"]
+        result["a_url"] = found["a_url"]
+    elif "video_src" in found:
+        result["video_src"] = found["video_src"]
+    return result
+
+
+def resolve_with_http(record):
+    try:
+        r = get_http_session().get(record.href, timeout=HTTP_RESOLVE_TIMEOUT)
+        if r.status_code != 200:
+            logger.debug(f"HTTP resolver got status {r.status_code} for {record.href}")
+            return None
+        return parse_video_page(r.text)
+    except Exception as e:
+        logger.debug(f"HTTP resolver failed for {record.href}: {e}")
+        return None
+
+
+def resolve_with_selenium(record, driver_pool, timeout=TIMEOUT_SUBDRIVER):
+    # Run scrape_sub_driver in its own thread so a hung sub-browser cannot
+    # block the resolver worker for longer than `timeout` seconds
+    scrape_result_container = {}
+
+    def thread_target():
+        scrape_result_container["data"] = scrape_sub_driver(record.href, driver_pool)
+
+    th = threading.Thread(target=thread_target, name=f"Scrape-{record.video_id}")
+    th.daemon = True
+    th.start()
+    th.join(timeout)
+
+    if th.is_alive():
+        # Driver sẽ được trả về pool (hoặc quit nếu pool đã shutdown) khi thread kết thúc.
+        logger.warning(f"Timeout {timeout}s -> skip video {record.video_id}.")
+        return None
+    return scrape_result_container.get("data")
+
+
+def resolve_video(record, driver_pool, backend="selenium"):
+    # The HTTP backend is tried first when selected; Selenium is the fallback.
+    # Each attempt is timed and counted under the backend that ran it.
+    if backend == "http":
+        with metrics.timer("resolve", backend="http"):
+            result_data = resolve_with_http(record)
+        if result_data and (result_data["video_src"] or (result_data["v_url"] and result_data["a_url"])):
+            resolver_stats.record("http", True)
+            logger.info(f"Resolved {record.video_id} over HTTP.")
+            return result_data
+        resolver_stats.record("http", False)
+        logger.info(f"HTTP resolver failed for {record.video_id}, falling back to Selenium.")
+
+    with metrics.timer("resolve", backend="selenium"):
+        result_data = resolve_with_selenium(record, driver_pool)
+    ok = bool(result_data and (result_data["video_src"] or (result_data["v_url"] and result_data["a_url"])))
+    resolver_stats.record("selenium", ok)
+    return result_data
+
+
+class ResolverStats:
+    """
+    Per-backend resolve outcomes, kept in metrics as resolves_total with
+    backend and result labels.
+    """
+
+    def record(self, backend, ok):
+        metrics.inc("resolves_total", backend=backend, result="success" if ok else "failure")
+
+    def log_summary(self):
+        stats = {}
+        for labels, value in metrics.counters_for("resolves_total").items():
+            labels = dict(labels)
+            success, total = stats.get(labels["backend"], (0, 0))
+            stats[labels["backend"]] = (success + (value if labels["result"] == "success" else 0), total + value)
+        for backend, (success, total) in sorted(stats.items()):
+            logger.info(f"Resolver [{backend}]: {success}/{total} succeeded")
+
+
+resolver_stats = ResolverStats()
+
+
+class ResolveCostStats:
+    """
+    Bytes transferred and browser memory per video-page resolve, to compare
+    the light resolver profile (RESOLVER_LIGHT_PROFILE) with a full one.
+    Bytes come from resource timing, which reports 0 for cross-origin
+    responses without Timing-Allow-Origin, so they are a lower bound. RSS is
+    only measured when psutil is installed. Kept in metrics as
+    resolve_pages_total, resolve_page_bytes_total and the
+    resolver_browser_rss_peak_bytes gauge.
+    """
 
-        # 3) Thử tìm single source (video_src)
+    def record_driver(self, driver):
         try:
-            vid_el = sub_driver.find_element(
-                By.XPATH,
-                '//*[@id="root"]/div/div[2]/div[1]/div/div[1]/ul/li[2]/div/video'
-            )
-            video_src = vid_el.get_attribute("src")
-            logger.debug(f"Single video src found: {video_src}")
+            page_bytes = driver.execute_script(PAGE_BYTES_JS) or 0
         except Exception as e:
-            logger.warning(f"Cannot find <video> element or src: {e}")
-            video_src = None
-
-        if video_src and not video_src.startswith("blob:"):
-            # Single-source detected
-            logger.info(f"Single-source detected: {video_src}")
-            result["video_src"] = video_src
-            return result
-
-        # 4) Nếu là splitted source, browse logs để tìm
-        logger.info("Splitted source suspected, checking logs...")
-        v_url, a_url = None, None
-        start_t = time.time()
+            logger.debug(f"Cannot read transferred bytes: {e}")
+            page_bytes = 0
+        rss = _browser_rss(driver)
+        logger.debug(f"Resolve cost: {page_bytes} bytes transferred, browser RSS {rss or 'n/a'}")
+        metrics.inc("resolve_pages_total")
+        metrics.inc("resolve_page_bytes_total", page_bytes)
+        if rss:
+            metrics.peak("resolver_browser_rss_peak_bytes", rss)
+
+    def log_summary(self):
+        count = metrics.counters_for("resolve_pages_total").get((), 0)
+        if not count:
+            return
+        avg_kb = metrics.counters_for("resolve_page_bytes_total").get((), 0) / count / 1024
+        peak_mb = metrics.peak_value("resolver_browser_rss_peak_bytes") / 1024 / 1024
+        logger.info(f"Resolve cost: {count} pages, avg {avg_kb:.0f} KB transferred, "
+                    f"peak browser RSS {peak_mb:.0f} MB" + ("" if psutil else " (install psutil to measure RSS)"))
+
+
+def _browser_rss(driver):
+    # Chrome runs as children of the chromedriver process started by the Service
+    if psutil is None:
+        return None
+    try:
+        proc = psutil.Process(driver.service.process.pid)
+        return sum(child.memory_info().rss for child in proc.children(recursive=True))
+    except (psutil.Error, AttributeError):
+        return None
+
+
+resolve_cost_stats = ResolveCostStats()
+
+
+def dispatch_download(record, result_data, task_queue, downloaded_manager, use_gpu=False, use_stream_merge=False):
+    video_src = result_data.get("video_src")
+    v_url = result_data.get("v_url")
+    a_url = result_data.get("a_url")
+
+    if video_src:
+        # Single-source
+        logger.info(f"Single-source detected: {video_src}")
+        # Add to task queue for direct download; it is marked downloaded once the file is complete
+        downloaded_manager.update(record.video_id, "resolved")
+        task_queue.add_task(
+            download_single,
+            video_src,
+            record.out_file,
+            video_id=record.video_id,
+            downloaded_manager=downloaded_manager
+        )
+    elif v_url and a_url:
+        logger.info(f"Splitted source: v_url={v_url}, a_url={a_url}")
+        sanitized_title = sanitize_filename(record.title)
+        tmp_v = os.path.join(record.temp_dir, f"{sanitized_title}.mp4")
+        tmp_a = os.path.join(record.temp_dir, f"{sanitized_title}.m4a")
+        downloaded_manager.update(record.video_id, "resolved")
+        task_queue.add_task(
+            download_merge_cleanup,
+            v_url,
+            a_url,
+            record.out_file,
+            tmp_v,
+            tmp_a,
+            use_gpu,
+            video_id=record.video_id,
+            downloaded_manager=downloaded_manager,
+            use_stream_merge=use_stream_merge
+        )
+    else:
+        logger.warning(f"No valid video src found for {record.video_id}, skip this video.")
+        downloaded_manager.mark_failed(record.video_id, FAIL_TRANSIENT)
+
+
+class ResolvedUrlCache:
+    """
+    Persistent LRU cache of video_id -> resolved media URLs, so retries and
+    restarts skip the browser. Each entry expires with its URLs: the expiry
+    is read from the CDN URL's query (x-expires etc.), minus a safety margin.
+    """
+
+    def __init__(self, db_path, max_entries=URL_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS resolved_urls (
+                video_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            )
+        """)
+        now = time.time()
+        self.conn.execute("DELETE FROM resolved_urls WHERE expires_at <= ?", (now,))
+        self.conn.commit()
+        rows = self.conn.execute(
+            "SELECT video_id, data, expires_at FROM resolved_urls ORDER BY used_at DESC LIMIT ?", (max_entries,)
+        ).fetchall()
+        for video_id, data, expires_at in reversed(rows):
+            self.entries[video_id] = (json.loads(data), expires_at)
+        logger.debug(f"Loaded {len(self.entries)} cached resolved URLs.")
+
+    @staticmethod
+    def expiry_of(result_data):
+        # The earliest expiry of the URLs in result_data, or None when they carry none
+        expiries = []
+        for url in (result_data.get("video_src"), result_data.get("v_url"), result_data.get("a_url")):
+            if not url:
+                continue
+            query = parse_qs(urlparse(url).query)
+            for key in URL_EXPIRY_PARAMS:
+                value = query.get(key, [None])[0]
+                if value and value.isdigit():
+                    expiries.append(int(value))
+                    break
+        return min(expiries) if expiries else None
+
+    def get(self, video_id):
+        with self.lock:
+            entry = self.entries.get(video_id)
+            if entry is None:
+                return None
+            result_data, expires_at = entry
+            if expires_at <= time.time():
+                self._delete(video_id)
+                return None
+            self.entries.move_to_end(video_id)
+            self.conn.execute("UPDATE resolved_urls SET used_at = ? WHERE video_id = ?", (time.time(), video_id))
+            self.conn.commit()
+            return result_data
+
+    def put(self, video_id, result_data):
+        now = time.time()
+        expiry = self.expiry_of(result_data)
+        expires_at = (expiry - URL_CACHE_MARGIN) if expiry else (now + URL_CACHE_DEFAULT_TTL)
+        if expires_at <= now:
+            return
+        with self.lock:
+            self.entries[video_id] = (result_data, expires_at)
+            self.entries.move_to_end(video_id)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO resolved_urls (video_id, data, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                (video_id, json.dumps(result_data), expires_at, now)
+            )
+            while len(self.entries) > self.max_entries:
+                oldest, _ = self.entries.popitem(last=False)
+                self.conn.execute("DELETE FROM resolved_urls WHERE video_id = ?", (oldest,))
+            self.conn.commit()
+
+    def invalidate(self, video_id):
+        with self.lock:
+            if video_id in self.entries:
+                self._delete(video_id)
+
+    def _delete(self, video_id):
+        self.entries.pop(video_id, None)
+        self.conn.execute("DELETE FROM resolved_urls WHERE video_id = ?", (video_id,))
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class FairQueue:
+    """
+    Bounded queue that hands out items round-robin across keys (channels),
+    so one huge channel cannot starve the others. put blocks while the
+    queue holds maxsize items or the key already has per_key items.
+    Supports task_done/join like queue.Queue; after close(), get returns
+    None once the queue is empty.
+    """
+
+    def __init__(self, maxsize, per_key):
+        self.maxsize = maxsize
+        self.per_key = per_key
+        self.cond = threading.Condition()
+        self.queues = OrderedDict()
+        self.size = 0
+        self.unfinished = 0
+        self.closed = False
+
+    def put(self, key, item):
+        with self.cond:
+            while self.size >= self.maxsize or len(self.queues.get(key, ())) >= self.per_key:
+                self.cond.wait()
+            self.queues.setdefault(key, deque()).append(item)
+            self.size += 1
+            self.unfinished += 1
+            self.cond.notify_all()
+
+    def get(self):
+        with self.cond:
+            while not self.size and not self.closed:
+                self.cond.wait()
+            if not self.size:
+                return None
+            key, items = next(iter(self.queues.items()))
+            item = items.popleft()
+            # Move this key to the back so the next get serves another channel
+            del self.queues[key]
+            if items:
+                self.queues[key] = items
+            self.size -= 1
+            self.cond.notify_all()
+            return item
+
+    def task_done(self):
+        with self.cond:
+            self.unfinished -= 1
+            if not self.unfinished:
+                self.cond.notify_all()
+
+    def join(self):
+        with self.cond:
+            while self.unfinished:
+                self.cond.wait()
+
+    def qsize(self):
+        with self.cond:
+            return self.size
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class ResolverPool:
+    """
+    Resolver stage of the pipeline: a fixed set of worker threads take
+    VideoRecords from a bounded queue, find their media URLs and hand them
+    to the download TaskQueue. A video stays in flight from submit() until
+    the state store records it as downloaded or failed, and is never queued
+    twice meanwhile.
+    """
+
+    def __init__(self, num_workers, max_pending, driver_pool, task_queue, downloaded_manager, use_gpu=False, backend="selenium",
+                 use_stream_merge=False, url_cache=None):
+        self.queue = FairQueue(maxsize=max_pending, per_key=RESOLVER_QUEUE_PER_CHANNEL)
+        self.driver_pool = driver_pool
+        self.url_cache = url_cache
+        self.backend = backend
+        self.task_queue = task_queue
+        self.downloaded_manager = downloaded_manager
+        self.use_gpu = use_gpu
+        self.use_stream_merge = use_stream_merge
+        self.in_flight = set()
+        self.in_flight_lock = threading.Lock()
+        downloaded_manager.add_final_listener(self._finished)
+        self.threads = []
+        for i in range(num_workers):
+            thread = threading.Thread(target=self.worker, name=f"Resolver-{i + 1}")
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        logger.debug(f"Started {num_workers} resolver workers.")
+
+    def worker(self):
         while True:
-            logs = sub_driver.get_log("performance")
-            for log_entry in logs:
-                try:
-                    msg = json.loads(log_entry["message"])["message"]
-                    if msg["method"] == "Network.requestWillBeSent":
-                        req_url = msg["params"]["request"]["url"]
-                        if "/media-video-avc1/" in req_url and not v_url:
-                            v_url = req_url
-                            logger.debug(f"Found video URL in logs: {v_url}")
-                        elif "/media-audio-und-mp4a/" in req_url and not a_url:
-                            a_url = req_url
-                            logger.debug(f"Found audio URL in logs: {a_url}")
-                        if v_url and a_url:
-                            break
-                except Exception as e:
-                    logger.debug(f"Error parsing log entry: {e}")
-            if v_url and a_url:
-                logger.info(f"Video URL: {v_url}")
-                logger.info(f"Audio URL: {a_url}")
-                result["v_url"] = v_url
-                result["a_url"] = a_url
-                break
-            if time.time() - start_t > 30:
-                logger.warning("Timeout: could not find splitted source URLs.")
-                break
-            time.sleep(1)
+            record = self.queue.get()
+            if record is None:
+                return
+            try:
+                # Still-valid URLs from an earlier attempt skip the browser entirely
+                result_data = self.url_cache.get(record.video_id) if self.url_cache else None
+                if result_data:
+                    logger.info(f"Using cached URLs for video {record.video_id}")
+                    metrics.inc("resolve_cache_hits_total")
+                else:
+                    logger.info(f"Resolving video {record.video_id}: {record.href}")
+                    result_data = resolve_video(record, self.driver_pool, self.backend)
+                    if self.url_cache and result_data and (
+                            result_data["video_src"] or (result_data["v_url"] and result_data["a_url"])):
+                        self.url_cache.put(record.video_id, result_data)
+                if not result_data:
+                    self.downloaded_manager.mark_failed(record.video_id, FAIL_TRANSIENT)
+                else:
+                    dispatch_download(
+                        record, result_data, self.task_queue, self.downloaded_manager,
+                        self.use_gpu, self.use_stream_merge
+                    )
+            except Exception as e:
+                logger.error(f"Error resolving video {record.video_id}: {e}")
+                self.downloaded_manager.mark_failed(record.video_id, FAIL_TRANSIENT)
+            finally:
+                self.queue.task_done()
+
+    def is_in_flight(self, video_id):
+        with self.in_flight_lock:
+            return video_id in self.in_flight
+
+    def _finished(self, video_id):
+        with self.in_flight_lock:
+            self.in_flight.discard(video_id)
+
+    def submit(self, record):
+        # Returns False (and queues nothing) when the video is already in flight
+        with self.in_flight_lock:
+            if record.video_id in self.in_flight:
+                return False
+            self.in_flight.add(record.video_id)
+        self.queue.put(record.channel_token, record)
+        logger.debug(f"Queued video {record.video_id} for resolving (pending: {self.queue.qsize()}).")
+        return True
 
-        return result
+    def wait_completion(self):
+        self.queue.join()
+        logger.debug("All videos have been resolved.")
 
-    finally:
-        if sub_driver:
-            sub_driver.quit()
+    def shutdown(self):
+        self.queue.close()
+        for thread in self.threads:
+            thread.join()
+        logger.debug("Resolver workers stopped.")
 
 
-def crawl_and_download_from_channel(channel_url, task_queue, downloaded_manager, use_gpu=False):
+def scroll_once(driver, last_height):
+    """
+    Scroll to the bottom and wait for new cards to be appended.
+    Returns the new page height, or None when the page did not grow.
+    """
+    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+    # Poll the page height until new cards are appended; SCROLL_WAIT_TIMEOUT is only a ceiling
+    try:
+        with wait_stats.measure("scroll"):
+            return WebDriverWait(driver, SCROLL_WAIT_TIMEOUT, poll_frequency=POLL_INTERVAL).until(
+                lambda d: _height_changed(d, last_height)
+            )
+    except TimeoutException:
+        return None
+
+
+class FeedCard:
+    __slots__ = ("video_id", "title", "href", "publish_time")
+
+    def __init__(self, video_id, title, href, publish_time):
+        self.video_id = video_id
+        self.title = title
+        self.href = href
+        self.publish_time = publish_time
+
+
+# Reads title, link and time of every card from index arguments[0] on, in one call
+EXTRACT_CARDS_JS = """
+var els = document.getElementsByClassName('feed-card-video-multi-item');
+var cards = [];
+for (var i = arguments[0]; i < els.length; i++) {
+    var a = els[i].querySelector('a');
+    var cover = els[i].querySelector('.feed-card-cover a');
+    var time = els[i].querySelector('.feed-card-footer-time-cmp');
+    cards.push({
+        title: a ? a.getAttribute('title') : null,
+        href: cover ? cover.href : null,
+        time_text: time ? time.innerText.trim() : ''
+    });
+}
+return JSON.stringify({total: els.length, cards: cards});
+"""
+
+
+def parse_feed_cards(raw, start_idx=0, seen_ids=None):
+    """
+    Turn the JSON returned by EXTRACT_CARDS_JS into FeedCards, dropping cards
+    without a video ID and IDs already in seen_ids (which is updated).
+    Returns (cards, total number of cards on the page).
+    """
+    data = json.loads(raw)
+    seen_ids = set() if seen_ids is None else seen_ids
+    cards = []
+    for idx, item in enumerate(data["cards"], start_idx + 1):
+        href = item.get("href")
+        video_id = extract_video_id(href) if href else None
+        if not video_id:
+            logger.warning(f"Could not extract video ID from card #{idx} ({href}), skip.")
+            continue
+        if video_id in seen_ids:
+            logger.debug(f"Duplicate card for video {video_id}, skip.")
+            continue
+        seen_ids.add(video_id)
+
+        time_text = item.get("time_text") or ""
+        try:
+            # Sometimes the time format might differ, adjust as per the site
+            publish_time = datetime.strptime(time_text, "%Y年%m月%d日").strftime("%Y-%m-%d")
+        except ValueError:
+            logger.debug(f"Time format not matched for '{time_text}'")
+            publish_time = "unknown_date"
+        cards.append(FeedCard(video_id, item.get("title") or f"video_{idx}", href, publish_time))
+    return cards, data["total"]
+
+
+def extract_feed_cards(driver, start_idx=0, seen_ids=None):
+    raw = driver.execute_script(EXTRACT_CARDS_JS, start_idx)
+    return parse_feed_cards(raw, start_idx, seen_ids)
+
+
+def crawl_and_download_from_channel(channel_url, resolver_pool, downloaded_manager, full=False):
     """
     Hàm duy nhất để:
       1) Mở channel
-      2) Scroll để lấy tất cả video
-      3) Cho từng video -> mở trang video -> tìm link video/audio
-      4) Tải về & merge ngay.
+      2) Scroll để lấy video; ở chế độ incremental (mặc định) dừng scroll khi
+         gặp INCREMENTAL_KNOWN_RUN video liên tiếp đã tải. full=True scroll hết MAX_PAGE.
+      3) Đẩy từng video mới vào resolver_pool (mở trang video -> tìm link video/audio)
+      4) Resolver đẩy tiếp sang task_queue để tải về & merge.
     """
     logger.info(f"====> CRAWLING CHANNEL: {channel_url}")
+
+    # Get channel token (if any)
+    channel_token = get_channel_token(channel_url)
+    if not channel_token:
+        logger.warning(f"No token found in URL: {channel_url}, skip.")
+        return
+
+    # Create output folder
+    result_dir = os.path.join(os.getcwd(), 'result')
+    os.makedirs(result_dir, exist_ok=True)
+    channel_dir = os.path.join(result_dir, channel_token)
+    os.makedirs(channel_dir, exist_ok=True)
+    logger.debug(f"Created channel directory: {channel_dir}")
+
+    # Create temp folder
+    temp_dir = os.path.join(os.getcwd(), 'temp')
+    os.makedirs(temp_dir, exist_ok=True)
+    logger.debug(f"Created temp directory: {temp_dir}")
+
+    last_video_id, last_publish_date = downloaded_manager.get_channel_state(channel_token)
+    if last_video_id and not full:
+        logger.info(f"Incremental crawl, last seen video: {last_video_id} ({last_publish_date})")
+
+    driver = None
+    newest = None
     try:
-        # Open channel in non-headless mode (as per initial logic).
-        driver = webdriver.Chrome(service=Service(DRIVER_PATH), options=options_first)
+        # Open channel (non-headless unless HEADLESS_CHANNEL) once the browser budget allows it
+        browser_budget.acquire("channel")
+        try:
+            with metrics.timer("browser_start", kind="channel"):
+                driver = webdriver.Chrome(service=Service(DRIVER_PATH), options=options_first)
+        except Exception:
+            browser_budget.release("channel")
+            raise
         driver.get(channel_url)
         logger.debug("Opened channel URL in browser.")
-        time.sleep(5)  # Wait for page to load
-
-        # Scroll to load all videos
-        def scroll():
-            logger.info(f"Scrolling channel page up to {MAX_PAGE} times...")
-            last_height = driver.execute_script("return document.body.scrollHeight")
-            logger.debug(f"Initial scroll height: {last_height}")
-            for page_idx in range(MAX_PAGE):
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                logger.debug(f"Scroll #{page_idx+1} to bottom...")
-                scrolled = False
-                for attempt in range(5):
-                    time.sleep(3)
-                    new_height = driver.execute_script("return document.body.scrollHeight")
-                    logger.debug(f"Attempt #{attempt+1}, new height: {new_height}")
-                    if new_height != last_height:
-                        last_height = new_height
-                        scrolled = True
-                        break
-                if not scrolled:
-                    logger.info("No further scroll progress, stopping.")
-                    break
-
-        scroll()
 
-        # Find video elements
-        els = driver.find_elements(By.CLASS_NAME, 'feed-card-video-multi-item')
-        logger.info(f"Found {len(els)} video elements on channel page.")
+        # Wait for the first video card instead of a fixed sleep
+        try:
+            with wait_stats.measure("channel_load"):
+                WebDriverWait(driver, CHANNEL_LOAD_TIMEOUT, poll_frequency=POLL_INTERVAL).until(
+                    EC.presence_of_element_located((By.CLASS_NAME, 'feed-card-video-multi-item'))
+                )
+        except TimeoutException:
+            logger.warning(f"No video card appeared within {CHANNEL_LOAD_TIMEOUT}s, continuing anyway.")
+
+        processed = 0
+        seen_ids = set()
+        known_run = 0
+        last_height = driver.execute_script("return document.body.scrollHeight")
+        logger.info(f"Scrolling channel page up to {MAX_PAGE} times...")
+        for page_idx in range(MAX_PAGE + 1):
+            # Handle the cards loaded since the previous scroll, read in one round-trip
+            with metrics.timer("card_extraction"):
+                cards, total = extract_feed_cards(driver, processed, seen_ids)
+            logger.info(f"Found {total - processed} new video elements on channel page.")
+            for card in cards:
+                logger.info(f"Title: {card.title}, URL: {card.href}, Time: {card.publish_time}")
+                try:
+                    # Remember the newest video of the channel for the next incremental run
+                    if newest is None or (card.publish_time != "unknown_date"
+                                          and (newest[1] == "unknown_date" or card.publish_time > newest[1])):
+                        newest = (card.video_id, card.publish_time)
+
+                    if _submit_video(card.video_id, card.title, card.href, card.publish_time, channel_token,
+                                     resolver_pool, downloaded_manager, full=full):
+                        known_run = 0
+                    else:
+                        known_run += 1
+                        if not full and card.video_id == last_video_id:
+                            # Everything below the newest video of the last crawl was seen already
+                            logger.info(f"Reached last seen video {card.video_id}.")
+                            known_run = max(known_run, INCREMENTAL_KNOWN_RUN)
+                            break
 
-        # Get channel token (if any)
-        channel_token = get_channel_token(channel_url)
-        if not channel_token:
-            logger.warning(f"No token found in URL: {channel_url}, skip.")
-            driver.quit()
-            return
+                except Exception as e:
+                    logger.error(f"Error on video {card.video_id}: {e}")
+            processed = total
 
-        # Create output folder
-        result_dir = os.path.join(os.getcwd(), 'result')
-        os.makedirs(result_dir, exist_ok=True)
-        channel_dir = os.path.join(result_dir, channel_token)
-        os.makedirs(channel_dir, exist_ok=True)
-        logger.debug(f"Created channel directory: {channel_dir}")
-
-        # Create temp folder
-        temp_dir = os.path.join(os.getcwd(), 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
-        logger.debug(f"Created temp directory: {temp_dir}")
-
-        # Iterate through each video element to find video/audio URLs and download
-        for idx, el in enumerate(els, 1):
-            logger.info(f"\n--- Video element #{idx} ---")
-            try:
-                title_el = el.find_element(By.TAG_NAME, "a")
-                title = title_el.get_attribute("title") or f"video_{idx}"
-                # Sanitize title to remove spaces and invalid characters
-                sanitized_title = sanitize_filename(title)
-                time_el = el.find_element(By.CLASS_NAME, "feed-card-footer-time-cmp").text
-                t = None
-                try:
-                    # Sometimes the time format might differ, adjust as per the site
-                    t = datetime.strptime(time_el, "%Y年%m月%d日")
-                except ValueError:
-                    logger.debug(f"Time format not matched for '{time_el}'")
-                    pass
-
-                href = el.find_element(By.CLASS_NAME, "feed-card-cover") \
-                         .find_element(By.TAG_NAME, "a") \
-                         .get_attribute("href")
-                publish_time = t.strftime("%Y-%m-%d") if t else "unknown_date"
-                logger.info(f"Title: {title}, URL: {href}, Time: {publish_time}")
-
-                # Extract video ID from URL (assuming it's the numeric part after /video/)
-                video_id = extract_video_id(href)
-                if not video_id:
-                    logger.warning(f"Could not extract video ID from URL: {href}, skip.")
-                    continue
-
-                # Check if already downloaded using DownloadedManager
-                if downloaded_manager.is_downloaded(video_id):
-                    logger.info(f"--> Video ID {video_id} already downloaded, skip.")
-                    continue
-
-                # Check if the output file already exists
-                out_file = os.path.join(channel_dir, f"{sanitized_title}.mp4")
-                if os.path.exists(out_file):
-                    logger.info(f"--> {out_file} exists, skipping download.")
-                    # Even if the file exists, ensure the video ID is recorded
-                    downloaded_manager.add_downloaded(video_id)
-                    continue
-
-                # -------------------- THÊM PHẦN THREAD ĐỂ TIMEOUT --------------------
-                TIMEOUT_SUBDRIVER = 30  # Thời gian tối đa (giây) để sub_driver scrape
-                scrape_result_container = {}
-
-                def thread_target():
-                    # Hàm này gọi scrape_sub_driver để lấy link video
-                    scrape_result_container["data"] = scrape_sub_driver(href, use_gpu=use_gpu)
-
-                th = threading.Thread(target=thread_target)
-                th.start()
-                th.join(TIMEOUT_SUBDRIVER)
-
-                if th.is_alive():
-                    # sub_driver đang treo quá lâu
-                    logger.warning(f"Timeout {TIMEOUT_SUBDRIVER}s -> skip this video.")
-                    # Thông thường ta nên kill cứng driver, 
-                    # nhưng ở đây ta đã 'quit()' trong finally => driver sẽ thoát khi thread kết thúc.
-                    # Ta chỉ "bỏ qua video" và sang video tiếp theo
-                    continue
-
-                # Nếu không treo, lấy dữ liệu
-                result_data = scrape_result_container.get("data", {})
-                video_src = result_data.get("video_src")
-                v_url = result_data.get("v_url")
-                a_url = result_data.get("a_url")
-
-                # 4) Proceed to download
-                if video_src:
-                    # Single-source
-                    logger.info(f"Single-source detected: {video_src}")
-                    # Add to task queue for direct download
-                    task_queue.add_task(download_file, video_src, out_file)
-                    # After successful download, add to downloaded_manager
-                    downloaded_manager.add_downloaded(video_id)
-                    continue
-                elif v_url and a_url:
-                    logger.info(f"Splitted source: v_url={v_url}, a_url={a_url}")
-                    tmp_v = os.path.join(temp_dir, f"{sanitized_title}.mp4")
-                    tmp_a = os.path.join(temp_dir, f"{sanitized_title}.m4a")
-                    task_queue.add_task(
-                        download_merge_cleanup,
-                        v_url,
-                        a_url,
-                        out_file,
-                        tmp_v,
-                        tmp_a,
-                        use_gpu,
-                        video_id=video_id,
-                        downloaded_manager=downloaded_manager
-                    )
-                else:
-                    logger.warning("No valid video src found, skip this video.")
+            if not full and known_run >= INCREMENTAL_KNOWN_RUN:
+                logger.info(f"Reached {known_run} already downloaded videos in a row, stopping scroll.")
+                break
+            if page_idx == MAX_PAGE:
+                break
+            logger.debug(f"Scroll #{page_idx+1} to bottom...")
+            with metrics.timer("channel_scroll"):
+                new_height = scroll_once(driver, last_height)
+            if new_height is None:
+                logger.info("No further scroll progress, stopping.")
+                break
+            logger.debug(f"New height: {new_height}")
+            last_height = new_height
 
-            except Exception as e:
-                logger.error(f"Error on element #{idx}: {e}")
+        if newest:
+            downloaded_manager.set_channel_state(channel_token, *newest)
 
     except Exception as e:
         logger.error(f"Failed to crawl channel {channel_url}: {e}")
     finally:
-        driver.quit()
+        if driver:
+            try:
+                driver.quit()
+            finally:
+                browser_budget.release("channel")
         logger.info(f"Done crawling + downloading from channel: {channel_url}")
 
 
+def make_video_record(video_id, title, href, publish_time, channel_token):
+    channel_dir = os.path.join(os.getcwd(), 'result', channel_token)
+    temp_dir = os.path.join(os.getcwd(), 'temp')
+    os.makedirs(channel_dir, exist_ok=True)
+    os.makedirs(temp_dir, exist_ok=True)
+    out_file = os.path.join(channel_dir, f"{sanitize_filename(title)}.mp4")
+    return VideoRecord(video_id, title, href, publish_time, out_file, temp_dir, channel_token)
+
+
+def _submit_video(video_id, title, href, publish_time, channel_token, resolver_pool, downloaded_manager,
+                  full=False):
+    """
+    Queue one video for resolving. Returns False when it is already known
+    (downloaded, in flight, waiting for a scheduled retry, or given up on),
+    True otherwise. Given-up videos are only queued again when full is set,
+    with their attempts reset.
+    """
+    # Check if already downloaded using the state store
+    if downloaded_manager.is_downloaded(video_id):
+        logger.info(f"--> Video ID {video_id} already downloaded, skip.")
+        return False
+    if resolver_pool.is_in_flight(video_id):
+        logger.info(f"--> Video ID {video_id} is already being processed, skip.")
+        return False
+    if downloaded_manager.is_retry_pending(video_id):
+        logger.info(f"--> Video ID {video_id} is scheduled for a retry, skip.")
+        return False
+    attempts = None
+    if downloaded_manager.is_given_up(video_id):
+        if not full:
+            logger.info(f"--> Video ID {video_id} failed for good earlier, skip (use --full to try again).")
+            return False
+        logger.info(f"--> Video ID {video_id} failed for good earlier, trying again (--full).")
+        attempts = 0
+
+    # Check if the output file already exists; a file cut short by a crash is downloaded again
+    record = make_video_record(video_id, title, href, publish_time, channel_token)
+    if os.path.exists(record.out_file):
+        if is_valid_output(record.out_file):
+            logger.info(f"--> {record.out_file} exists, skipping download.")
+            # Even if the file exists, ensure the video ID is recorded
+            downloaded_manager.add_downloaded(video_id, size=os.path.getsize(record.out_file))
+            return False
+        logger.warning(f"--> {record.out_file} exists but is incomplete, downloading again.")
+
+    # Hand the video over to the resolver stage; blocks when the
+    # resolver queue is full so the channel walk cannot run ahead
+    downloaded_manager.update(
+        video_id, "discovered", attempts=attempts,
+        channel_token=channel_token, title=title, publish_date=publish_time, href=href
+    )
+    if not resolver_pool.submit(record):
+        logger.info(f"--> Video ID {video_id} is already being processed, skip.")
+        return False
+    metrics.inc("videos_discovered_total")
+    return True
+
+
+class RetryScheduler:
+    """
+    Resubmits failed videos to the resolver stage once their backoff has
+    elapsed (see DownloadStateStore.mark_failed). Pending retries live in the
+    state store, so they survive restarts. At most one retry per host is
+    released every host_interval seconds so retries don't hammer the CDN.
+    """
+
+    def __init__(self, downloaded_manager, resolver_pool, host_interval=RETRY_HOST_INTERVAL):
+        self.downloaded_manager = downloaded_manager
+        self.resolver_pool = resolver_pool
+        self.host_interval = host_interval
+        self.last_by_host = {}
+        self.lock = threading.Lock()
+        self.dispatching = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name="RetryScheduler")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _host_of(self, video_id, href):
+        url_cache = self.resolver_pool.url_cache
+        cached = url_cache.get(video_id) if url_cache else None
+        url = (cached and (cached.get("video_src") or cached.get("v_url"))) or href
+        return urlparse(url).netloc
+
+    def _allow(self, host, now):
+        if now - self.last_by_host.get(host, 0) < self.host_interval:
+            return False
+        self.last_by_host[host] = now
+        return True
+
+    def dispatch_due(self):
+        now = time.time()
+        for video_id, title, href, publish_date, channel_token, reason in self.downloaded_manager.due_retries(now):
+            if not href or not channel_token:
+                logger.warning(f"Cannot retry video {video_id}: page URL unknown.")
+                self.downloaded_manager.update(video_id, "failed", next_retry_at=0)
+                continue
+            if reason == FAIL_EXPIRED and self.resolver_pool.url_cache:
+                self.resolver_pool.url_cache.invalidate(video_id)
+            if self.resolver_pool.is_in_flight(video_id):
+                continue
+            if not self._allow(self._host_of(video_id, href), now):
+                continue
+            with self.lock:
+                self.dispatching += 1
+            try:
+                logger.info(f"Retrying video {video_id} (last failure: {reason})")
+                metrics.inc("retries_total", reason=reason)
+                self.downloaded_manager.update(video_id, "discovered", next_retry_at=0)
+                record = make_video_record(video_id, title or f"video_{video_id}", href, publish_date, channel_token)
+                if not self.resolver_pool.submit(record):
+                    logger.debug(f"Video {video_id} is already in flight, retry not queued.")
+            finally:
+                with self.lock:
+                    self.dispatching -= 1
+
+    def busy(self):
+        with self.lock:
+            return self.dispatching > 0
+
+    def _loop(self):
+        while not self.stop_event.wait(RETRY_POLL_INTERVAL):
+            try:
+                self.dispatch_due()
+            except Exception as e:
+                logger.error(f"Error dispatching retries: {e}")
+
+    def shutdown(self):
+        self.stop_event.set()
+        self.thread.join()
+        logger.debug("Retry scheduler stopped.")
+
+
+def run_crawl(channels, use_gpu=False, resolver="selenium", stream_merge=False, full=False,
+              metrics_port=None, summary_file=RUN_SUMMARY_PATH, retry_wait=RETRY_WAIT_AT_EXIT):
+    """
+    Crawl and download every channel in channels with the full pipeline
+    (channel walk -> resolver -> downloads -> mux), then wait for it to drain.
+    """
+    # Initialize TaskQueue with desired maximum threads
+    task_queue = TaskQueue(max_threads=MAX_THREADS, max_pending=DOWNLOAD_QUEUE_SIZE)
+
+    # Initialize the state store; downloaded.txt is imported into it on first run
+    downloaded_manager = DownloadStateStore(STATE_DB_PATH, legacy_path="downloaded.txt")
+
+    # Resolved media URLs kept until they expire, shared across runs
+    url_cache = ResolvedUrlCache(STATE_DB_PATH)
+
+    # Warm sub-browsers shared by all channels for opening video pages
+    driver_pool = SubDriverPool(size=SUB_DRIVER_POOL_SIZE, max_uses=SUB_DRIVER_MAX_USES)
+    # Idle sub-browsers give their slot back when a channel page needs one
+    browser_budget.add_reclaimer(driver_pool.trim_idle)
+
+    # Resolver stage: finds media URLs while earlier videos are downloading
+    resolver_pool = ResolverPool(
+        num_workers=RESOLVER_THREADS,
+        max_pending=RESOLVER_QUEUE_SIZE,
+        driver_pool=driver_pool,
+        task_queue=task_queue,
+        downloaded_manager=downloaded_manager,
+        use_gpu=use_gpu,
+        backend=resolver,
+        use_stream_merge=stream_merge,
+        url_cache=url_cache
+    )
+
+    # Resubmits failed videos once their backoff has elapsed
+    retry_scheduler = RetryScheduler(downloaded_manager, resolver_pool)
+
+    # Queue depths and live browsers, read whenever metrics are rendered
+    metrics.gauge("resolver_queue_depth", resolver_pool.queue.qsize)
+    metrics.gauge("download_queue_depth", lambda: task_queue.unfinished)
+    metrics.gauge("mux_queue_depth", mux_pool.queue_depth)
+    metrics.gauge("live_browsers", lambda: browser_budget.live)
+    metrics_server = start_metrics_server(metrics_port) if metrics_port else None
+
+    try:
+        # Crawl up to CHANNEL_THREADS channels at once within the browser budget
+        with ThreadPoolExecutor(max_workers=CHANNEL_THREADS, thread_name_prefix="Channel") as channel_executor:
+            for ch_url in channels:
+                channel_executor.submit(
+                    crawl_and_download_from_channel, ch_url, resolver_pool, downloaded_manager, full=full
+                )
+
+        # Wait for all videos to be resolved, then for all downloads and merges to complete;
+        # keep going while retries come due within retry_wait seconds
+        retry_deadline = time.time() + retry_wait
+        while True:
+            resolver_pool.wait_completion()
+            task_queue.wait_completion()
+            mux_pool.wait_completion()
+            if retry_scheduler.busy():
+                time.sleep(POLL_INTERVAL)
+                continue
+            next_retry = downloaded_manager.next_retry_time()
+            if not next_retry or next_retry > retry_deadline:
+                break
+            time.sleep(max(next_retry - time.time(), 0) + RETRY_POLL_INTERVAL)
+        mux_pool.shutdown()
+        pending_retries = downloaded_manager.next_retry_time()
+        if pending_retries:
+            logger.info(f"Some retries are scheduled after this run; next one at "
+                        f"{datetime.fromtimestamp(pending_retries):%Y-%m-%d %H:%M:%S}.")
+    finally:
+        retry_scheduler.shutdown()
+        resolver_pool.shutdown()
+        driver_pool.shutdown()
+        task_queue.shutdown()
+        downloaded_manager.close()
+        url_cache.close()
+        wait_stats.log_summary()
+        resolver_stats.log_summary()
+        resolve_cost_stats.log_summary()
+        if metrics_server:
+            metrics_server.shutdown()
+        if summary_file:
+            metrics.write_summary(summary_file)
+    logger.info("All downloads and merges are complete.")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--url-file", help="File with channel URLs")
     parser.add_argument('--gpu', action='store_true', help='Use GPU for encoding')
+    parser.add_argument('--resolver', choices=["selenium", "http"], default="selenium",
+                        help='How to find media URLs: "http" parses the page without a browser and falls back to Selenium')
+    parser.add_argument('--stream-merge', action='store_true',
+                        help='Let ffmpeg read split video/audio straight from the CDN instead of via temp files')
+    parser.add_argument('--full', action='store_true',
+                        help='Scroll the whole channel (MAX_PAGE) instead of stopping at already downloaded '
+                             'videos, and try again videos that failed for good')
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help='Serve Prometheus metrics on http://127.0.0.1:PORT/metrics')
+    parser.add_argument('--summary-file', default=RUN_SUMMARY_PATH,
+                        help='Where to write the JSON run summary at exit')
     args = parser.parse_args()
 
     if args.url_file:
         logger.info("Starting downloader...")
         channels = get_channel_url_from_txt(args.url_file)
 
-        # Initialize TaskQueue with desired maximum threads
-        task_queue = TaskQueue(max_threads=MAX_THREADS)
-
-        # Initialize DownloadedManager with the path to the downloaded IDs file
-        downloaded_manager = DownloadedManager(filepath="downloaded.txt")
-
-        for ch_url in channels:
-            crawl_and_download_from_channel(ch_url, task_queue, downloaded_manager, use_gpu=args.gpu)
-
-        # Wait for all tasks to complete
-        task_queue.wait_completion()
-        logger.info("All downloads and merges are complete.")
+        run_crawl(
+            channels,
+            use_gpu=args.gpu,
+            resolver=args.resolver,
+            stream_merge=args.stream_merge,
+            full=args.full,
+            metrics_port=args.metrics_port,
+            summary_file=args.summary_file
+        )
     else:
         logger.warning("No --url-file provided. Exiting.")
@@ -0,0 +1,86 @@
+import os
+import re
+import sys
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+# main.py and constant.py live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    """
+    Range-capable file server for download tests. faults maps a path to the
+    outcomes of its next requests: an int is answered as that status, "drop"
+    sends half of the requested bytes and closes the connection, "norange"
+    ignores the Range header and sends the whole file.
+    """
+
+    protocol_version = "HTTP/1.1"
+    payload = b""
+    delay = 0.0
+    faults = {}
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        self.requests.append((path, self.headers.get("Range")))
+        pending = self.faults.get(path)
+        fault = pending.pop(0) if pending else None
+        if isinstance(fault, int):
+            self.send_response(fault)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        size = len(self.payload)
+        start, end = 0, size - 1
+        m = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", "")) if fault != "norange" else None
+        if m:
+            start = int(m.group(1))
+            end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+        self.send_response(206 if m else 200)
+        self.send_header("Accept-Ranges", "bytes")
+        if m:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if self.delay:
+            threading.Event().wait(self.delay)
+        body = self.payload[start:end + 1]
+        if fault == "drop":
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def media_server():
+    handler = type("Handler", (MediaHandler,), {
+        "payload": os.urandom(1024 * 1024),
+        "faults": {},
+        "requests": [],
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield SimpleNamespace(url=f"http://127.0.0.1:{server.server_port}", handler=handler)
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,71 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_stream_download(media_server, tmp_path):
+    out_file = str(tmp_path / "video.mp4")
+    assert main.download_file(media_server.url + "/video.mp4", out_file) is True
+    assert _read(out_file) == media_server.handler.payload
+    assert not (tmp_path / "video.mp4.part").exists()
+    assert not (tmp_path / "video.mp4.part.json").exists()
+
+
+def test_segmented_download(media_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DOWNLOAD_SEGMENT_MIN_SIZE", 0)
+    out_file = str(tmp_path / "video.mp4")
+    main.download_file(media_server.url + "/video.mp4", out_file)
+    assert _read(out_file) == media_server.handler.payload
+    ranges = [r for path, r in media_server.handler.requests if r and r != "bytes=0-0"]
+    assert len(ranges) == main.DOWNLOAD_SEGMENTS
+
+
+def test_resume_after_dropped_connection(media_server, tmp_path, monkeypatch):
+    # Small chunks, so the bytes received before the drop reach the .part file
+    monkeypatch.setattr(main, "DOWNLOAD_CHUNK_SIZE", 64 * 1024)
+    media_server.handler.faults["/video.mp4"] = [None, "drop"]
+    out_file = str(tmp_path / "video.mp4")
+    main.download_file(media_server.url + "/video.mp4", out_file)
+    assert _read(out_file) == media_server.handler.payload
+    # probe, the dropped request, then a resume from where it stopped
+    half = len(media_server.handler.payload) // 2
+    assert media_server.handler.requests[2][1] == f"bytes={half}-"
+
+
+def test_concurrent_segmented_downloads_reuse_pooled_connections(media_server, tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(main, "DOWNLOAD_SEGMENT_MIN_SIZE", 0)
+    media_server.handler.delay = 0.2
+    caplog.set_level(logging.WARNING, logger="urllib3.connectionpool")
+    url = media_server.url + "/video.mp4"
+    with ThreadPoolExecutor(max_workers=main.DOWNLOAD_PER_HOST) as executor:
+        paths = [str(tmp_path / f"video_{idx}.mp4") for idx in range(main.DOWNLOAD_PER_HOST)]
+        list(executor.map(lambda path: main.download_file(url, path), paths))
+    for path in paths:
+        assert _read(path) == media_server.handler.payload
+    assert not [r for r in caplog.records if "Connection pool is full" in r.getMessage()]
+
+
+def test_preallocated_part_without_progress_starts_over(media_server, tmp_path):
+    # A crash after preallocation but before any progress was saved
+    out_file = str(tmp_path / "video.mp4")
+    with open(out_file + ".part", "wb") as f:
+        f.truncate(len(media_server.handler.payload))
+    main.download_file(media_server.url + "/video.mp4", out_file)
+    assert _read(out_file) == media_server.handler.payload
+    assert media_server.handler.requests[1][1] is None
+
+
+def test_legacy_part_without_progress_resumes(media_server, tmp_path):
+    out_file = str(tmp_path / "video.mp4")
+    half = len(media_server.handler.payload) // 2
+    with open(out_file + ".part", "wb") as f:
+        f.write(media_server.handler.payload[:half])
+    main.download_file(media_server.url + "/video.mp4", out_file)
+    assert _read(out_file) == media_server.handler.payload
+    assert media_server.handler.requests[1][1] == f"bytes={half}-"
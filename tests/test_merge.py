@@ -0,0 +1,30 @@
+import subprocess
+
+import pytest
+
+import main
+
+
+def _fake_ffprobe(monkeypatch, output):
+    def run(cmd, **kwargs):
+        return subprocess.CompletedProcess(cmd, 0, stdout=output.encode(), stderr=b"")
+    monkeypatch.setattr(main.subprocess, "run", run)
+
+
+@pytest.mark.parametrize("output, complete", [
+    ("video,60.000000\naudio,59.950000\n", True),
+    ("video,N/A\naudio,59.950000\n", True),
+    ("video,60.000000\n", False),
+    ("video,60.000000\naudio,12.500000\n", False),
+    ("", False),
+])
+def test_incomplete_merge(monkeypatch, output, complete):
+    _fake_ffprobe(monkeypatch, output)
+    assert (main._incomplete_merge("out.mp4.part") is None) == complete
+
+
+def test_incomplete_merge_without_ffprobe(monkeypatch):
+    def run(cmd, **kwargs):
+        raise FileNotFoundError(cmd[0])
+    monkeypatch.setattr(main.subprocess, "run", run)
+    assert main._incomplete_merge("out.mp4.part") is None
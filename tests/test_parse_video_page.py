@@ -0,0 +1,34 @@
+from main import parse_video_page
+from tests.conftest import read_fixture
+
+VIDEO_URL = "https://v3-default.ixigua.com/abc/media-video-avc1/v0300fg10000.mp4?x-expires=1790000000&sig=1"
+AUDIO_URL = "https://v3-default.ixigua.com/abc/media-audio-und-mp4a/v0300fg10000.m4a?x-expires=1790000000&sig=2"
+
+
+def test_split_sources_in_render_data():
+    result = parse_video_page(read_fixture("split_render_data.html"))
+    assert result == {"video_src": None, "v_url": VIDEO_URL, "a_url": AUDIO_URL}
+
+
+def test_url_encoded_render_data():
+    result = parse_video_page(read_fixture("encoded_render_data.html"))
+    assert result == {"video_src": None, "v_url": VIDEO_URL, "a_url": AUDIO_URL}
+
+
+def test_progressive_play_url():
+    result = parse_video_page(read_fixture("progressive_play_url.html"))
+    assert result == {
+        "video_src": "https://v9-xg-web-pc.ixigua.com/video/tos/cn/progressive.mp4?x-expires=1790000000",
+        "v_url": None,
+        "a_url": None,
+    }
+
+
+def test_escaped_urls_in_raw_html():
+    result = parse_video_page(read_fixture("escaped_urls.html"))
+    assert result == {"video_src": None, "v_url": VIDEO_URL, "a_url": AUDIO_URL}
+
+
+def test_page_without_media():
+    result = parse_video_page(read_fixture("no_media.html"))
+    assert result == {"video_src": None, "v_url": None, "a_url": None}
@@ -0,0 +1,139 @@
+import time
+
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("status, reason", [
+    (401, main.FAIL_EXPIRED),
+    (403, main.FAIL_EXPIRED),
+    (404, main.FAIL_EXPIRED),
+    (410, main.FAIL_EXPIRED),
+    (408, main.FAIL_TRANSIENT),
+    (429, main.FAIL_TRANSIENT),
+    (500, main.FAIL_TRANSIENT),
+    (503, main.FAIL_TRANSIENT),
+    (400, main.FAIL_PERMANENT),
+    (416, main.FAIL_PERMANENT),
+])
+def test_classify_status(status, reason):
+    assert main.classify_status(status) == reason
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = main.DownloadStateStore(str(tmp_path / "state.db"))
+    yield store
+    store.close()
+
+
+def _next_retry_at(store, video_id):
+    store.flush()
+    return store._row(video_id, "next_retry_at")[0]
+
+
+def test_mark_failed_backs_off_exponentially(store, monkeypatch):
+    monkeypatch.setattr(main.random, "uniform", lambda a, b: 1.0)
+    for attempt in range(1, main.RETRY_MAX_ATTEMPTS):
+        before = time.time()
+        store.mark_failed("v1", main.FAIL_TRANSIENT)
+        delay = min(main.RETRY_MAX_DELAY, main.RETRY_BASE_DELAY * 2 ** (attempt - 1))
+        assert _next_retry_at(store, "v1") == pytest.approx(before + delay, abs=1)
+        assert store.is_retry_pending("v1")
+
+    # The last allowed attempt failed too: no further retry is scheduled
+    store.mark_failed("v1", main.FAIL_TRANSIENT)
+    assert _next_retry_at(store, "v1") == 0
+    assert not store.is_retry_pending("v1")
+    assert store._row("v1", "attempts")[0] == main.RETRY_MAX_ATTEMPTS
+
+
+def test_mark_failed_permanent_is_not_retried(store):
+    store.mark_failed("v1", main.FAIL_PERMANENT)
+    assert _next_retry_at(store, "v1") == 0
+    assert store._row("v1", "fail_reason")[0] == main.FAIL_PERMANENT
+
+
+def test_due_retries(store):
+    store.update("v1", "discovered", channel_token="tok", title="t", href="https://www.toutiao.com/video/1/")
+    store.mark_failed("v1", main.FAIL_EXPIRED)
+    assert store.due_retries(time.time()) == []
+    due = store.due_retries(time.time() + main.RETRY_MAX_DELAY * 2)
+    assert [(row[0], row[-1]) for row in due] == [("v1", main.FAIL_EXPIRED)]
+
+
+def _download_error(url, tmp_path):
+    with pytest.raises(main.DownloadFailed) as info:
+        main.download_file(url, str(tmp_path / "video.mp4"))
+    return info.value
+
+
+def test_download_403_is_expired(media_server, tmp_path):
+    media_server.handler.faults["/video.mp4"] = [403]
+    assert _download_error(media_server.url + "/video.mp4", tmp_path).reason == main.FAIL_EXPIRED
+
+
+def test_download_503_is_transient(media_server, tmp_path):
+    media_server.handler.faults["/video.mp4"] = [None, 503]
+    assert _download_error(media_server.url + "/video.mp4", tmp_path).reason == main.FAIL_TRANSIENT
+
+
+def test_download_dropped_connections_are_transient(media_server, tmp_path):
+    media_server.handler.faults["/video.mp4"] = [None] + ["drop"] * main.DOWNLOAD_RESUME_RETRIES
+    assert _download_error(media_server.url + "/video.mp4", tmp_path).reason == main.FAIL_TRANSIENT
+    # The partial file is kept for the next attempt
+    assert (tmp_path / "video.mp4.part").exists()
+
+
+def test_retry_and_channel_walk_do_not_queue_a_video_twice(store, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # No workers: submitted records stay in the queue where they can be counted
+    pool = main.ResolverPool(0, 10, driver_pool=None, task_queue=None, downloaded_manager=store)
+    scheduler = main.RetryScheduler(store, pool, host_interval=0)
+    try:
+        href = "https://www.toutiao.com/video/1/"
+        store.update("1", "discovered", channel_token="tok", title="t", href=href, publish_date="2024-01-01")
+        store.mark_failed("1", main.FAIL_TRANSIENT)
+        store.update("1", "failed", next_retry_at=time.time() - 1)
+
+        scheduler.dispatch_due()
+        assert pool.is_in_flight("1")
+        assert not main._submit_video("1", "t", href, "2024-01-01", "tok", pool, store)
+        assert pool.queue.qsize() == 1
+
+        # Once the video reaches a final status it may be queued again
+        store.add_downloaded("1")
+        assert not pool.is_in_flight("1")
+    finally:
+        scheduler.shutdown()
+        pool.shutdown()
+
+
+def test_channel_walk_skips_given_up_videos_unless_full(store, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pool = main.ResolverPool(0, 10, driver_pool=None, task_queue=None, downloaded_manager=store)
+    try:
+        href = "https://www.toutiao.com/video/1/"
+        store.update("1", "discovered", channel_token="tok", title="t", href=href, publish_date="2024-01-01")
+        store.mark_failed("1", main.FAIL_PERMANENT)
+
+        assert not main._submit_video("1", "t", href, "2024-01-01", "tok", pool, store)
+        assert store._row("1", "status", "attempts") == ("failed", 1)
+        assert pool.queue.qsize() == 0
+
+        assert main._submit_video("1", "t", href, "2024-01-01", "tok", pool, store, full=True)
+        assert store._row("1", "status", "attempts") == ("discovered", 0)
+        assert pool.queue.qsize() == 1
+    finally:
+        pool.shutdown()
+
+
+def test_segment_without_range_support_falls_back_to_stream(media_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DOWNLOAD_SEGMENT_MIN_SIZE", 0)
+    # The probe gets a range, the first segment request the whole file
+    media_server.handler.faults["/video.mp4"] = [None, "norange"]
+    out_file = str(tmp_path / "video.mp4")
+    assert main.download_file(media_server.url + "/video.mp4", out_file) is True
+    with open(out_file, "rb") as f:
+        assert f.read() == media_server.handler.payload